@@ -0,0 +1,52 @@
+# SPDX-PackageName: rf-pymods
+# SPDX-PackageSupplier: Ryan Finnie <ryan@finnie.org>
+# SPDX-PackageDownloadLocation: https://forge.colobox.com/rfinnie/rf-pymods
+# SPDX-FileCopyrightText: © 2026 Ryan Finnie <ryan@finnie.org>
+# SPDX-License-Identifier: MIT
+
+import argparse
+import contextlib
+import os
+import time
+
+from rf_pymods.auto_pager import AutoPager
+
+
+def bench_print(lines, **kwargs):
+    with AutoPager(**kwargs) as pager:
+        for i in range(lines):
+            print(i, file=pager)
+
+
+def bench_write(lines, **kwargs):
+    with AutoPager(**kwargs) as pager:
+        for i in range(lines):
+            pager.write("{}\n".format(i))
+
+
+def bench_writelines(lines, **kwargs):
+    with AutoPager(**kwargs) as pager:
+        pager.writelines("{}\n".format(i) for i in range(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AutoPager buffered writes")
+    parser.add_argument("--lines", type=int, default=1000000, help="number of lines to write per run")
+    parser.add_argument("--output", default=os.devnull, help="file to send output to (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = []
+    with open(args.output, "w") as fh:
+        for func in (bench_print, bench_write, bench_writelines):
+            for buffer_size in (0, 8192, 65536):
+                with contextlib.redirect_stdout(fh):
+                    start = time.perf_counter()
+                    func(args.lines, buffer_size=buffer_size)
+                    elapsed = time.perf_counter() - start
+                results.append((func.__name__, buffer_size, args.lines / elapsed))
+    for name, buffer_size, rate in results:
+        print("{:>16} buffer_size={:<5}: {:11.1f} lines/s".format(name, buffer_size, rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# SPDX-PackageName: rf-pymods
+# SPDX-PackageSupplier: Ryan Finnie <ryan@finnie.org>
+# SPDX-PackageDownloadLocation: https://forge.colobox.com/rfinnie/rf-pymods
+# SPDX-FileCopyrightText: © 2026 Ryan Finnie <ryan@finnie.org>
+# SPDX-License-Identifier: MIT
+
+import argparse
+import timeit
+
+from rf_pymods.numfmt import NumberFormat, _compile, _formatter, numfmt
+
+
+class UncompiledNumberFormat(NumberFormat):
+    # NumberFormat as it was before format strings were compiled
+    def __str__(self):
+        return self.fmt.format(num=self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark numfmt formatting with and without compiled format caching")
+    parser.add_argument("--number", type=int, default=100000, help="number of operations per run")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs, of which the fastest is reported")
+    parser.add_argument("--fmt", default="{num.real:0.02f} {num.prefix}", help="format string to benchmark")
+    args = parser.parse_args()
+
+    num = numfmt(12345678, fmt=args.fmt)
+    old = UncompiledNumberFormat(num)
+    old.fmt = num.fmt
+    old.prefix = num.prefix
+    uncompiled = _compile.__wrapped__
+    uncached = _formatter.__wrapped__
+    benches = (
+        ("str", lambda: str(num), lambda: str(old)),
+        ("repr", lambda: repr(num), lambda: repr(old)),
+        ("f-string", lambda: f"{num}", lambda: f"{old}"),
+        ("compile", lambda: _compile(args.fmt)(num), lambda: uncompiled(args.fmt)(num)),
+        ("numfmt", lambda: numfmt(12345678, fmt=args.fmt), lambda: uncached(args.fmt, False, 1.0, 0, None)(12345678)),
+    )
+    for name, cached, baseline in benches:
+        results = []
+        for func in (baseline, cached):
+            elapsed = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+            results.append(args.number / elapsed)
+        print("{:>8}: {:11.1f} ops/s uncached, {:11.1f} ops/s cached ({:.2f}x)".format(name, *results, results[1] / results[0]))
+
+
+if __name__ == "__main__":
+    main()
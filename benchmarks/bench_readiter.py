@@ -0,0 +1,64 @@
+# SPDX-PackageName: rf-pymods
+# SPDX-PackageSupplier: Ryan Finnie <ryan@finnie.org>
+# SPDX-PackageDownloadLocation: https://forge.colobox.com/rfinnie/rf-pymods
+# SPDX-FileCopyrightText: © 2026 Ryan Finnie <ryan@finnie.org>
+# SPDX-License-Identifier: MIT
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from rf_pymods.readiter import readiter
+
+
+def bench(filename, **kwargs):
+    """Hash a file through readiter
+
+    Returns the seconds taken and the number of block buffers which
+    were allocated along the way.
+    """
+    sha = hashlib.sha256()
+    allocations = 0
+    buffers = set()
+    start = time.perf_counter()
+    with open(filename, "rb") as fh:
+        for block in readiter(fh, **kwargs):
+            sha.update(block)
+            if isinstance(block, memoryview):
+                buffers.add(id(block.obj))
+            else:
+                allocations += 1
+    elapsed = time.perf_counter() - start
+    return elapsed, allocations + len(buffers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark readiter methods")
+    parser.add_argument("--file-size", type=int, default=256 * 1024 * 1024, help="size of the generated test file")
+    parser.add_argument("--size", type=int, default=65536, help="readiter block size")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as tf:
+        block = os.urandom(1024 * 1024)
+        for _ in range(max(args.file_size // len(block), 1)):
+            tf.write(block)
+        tf.flush()
+        file_size = os.stat(tf.name).st_size
+        for label, kwargs in (
+            ("read", {"method": "read"}),
+            ("readinto", {"method": "readinto"}),
+            ("mmap", {"method": "mmap"}),
+            ("read+prefetch", {"method": "read", "prefetch": 4}),
+            ("read+auto", {"method": "read", "size": "auto"}),
+        ):
+            # First pass warms the page cache
+            kwargs = {"size": args.size, **kwargs}
+            bench(tf.name, **kwargs)
+            elapsed, allocations = bench(tf.name, **kwargs)
+            print("{:>15}: {:9.2f} MB/s, {} block allocations".format(label, file_size / elapsed / 1000000, allocations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# SPDX-PackageName: rf-pymods
+# SPDX-PackageSupplier: Ryan Finnie <ryan@finnie.org>
+# SPDX-PackageDownloadLocation: https://forge.colobox.com/rfinnie/rf-pymods
+# SPDX-FileCopyrightText: © 2026 Ryan Finnie <ryan@finnie.org>
+# SPDX-License-Identifier: MIT
+
+import argparse
+import random
+import tempfile
+import time
+
+from rf_pymods.readiter import readrecords
+
+
+def bench_splitlines(filename):
+    with open(filename, "rb") as fh:
+        return len(fh.read().splitlines())
+
+
+def bench_readrecords(filename, **kwargs):
+    with open(filename, "rb") as fh:
+        return sum(1 for _ in readrecords(fh, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark readrecords against splitlines")
+    parser.add_argument("--lines", type=int, default=2000000, help="number of lines in the generated test file")
+    parser.add_argument("--size", type=int, default=65536, help="readrecords block size")
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as tf:
+        for _ in range(args.lines):
+            tf.write(b"x" * random.randint(0, 200) + b"\n")
+        tf.flush()
+        for label, func, kwargs in (
+            ("splitlines", bench_splitlines, {}),
+            ("readrecords", bench_readrecords, {"size": args.size}),
+        ):
+            # First pass warms the page cache
+            func(tf.name, **kwargs)
+            start = time.perf_counter()
+            records = func(tf.name, **kwargs)
+            elapsed = time.perf_counter() - start
+            print("{:>12}: {:12.0f} records/s".format(label, records / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# SPDX-PackageName: rf-pymods
+# SPDX-PackageSupplier: Ryan Finnie <ryan@finnie.org>
+# SPDX-PackageDownloadLocation: https://forge.colobox.com/rfinnie/rf-pymods
+# SPDX-FileCopyrightText: © 2026 Ryan Finnie <ryan@finnie.org>
+# SPDX-License-Identifier: MIT
+
+import argparse
+import os
+import tempfile
+import time
+
+from rf_pymods.safe_write import SafeWriteTransaction, safe_write
+
+
+def bench_single(path, files, data, **kwargs):
+    for i in range(files):
+        with safe_write(os.path.join(path, "file{}".format(i)), mode="wb", **kwargs) as f:
+            f.write(data)
+
+
+def bench_transaction(path, files, data, **kwargs):
+    with SafeWriteTransaction() as txn:
+        for i in range(files):
+            with txn.open(os.path.join(path, "file{}".format(i)), mode="wb", **kwargs) as f:
+                f.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark safe_write durability levels")
+    parser.add_argument("--files", type=int, default=200, help="number of files to write per run")
+    parser.add_argument("--file-size", type=int, default=4096, help="size of each file")
+    parser.add_argument("--dir", default=None, help="directory to write to (default: system temporary directory)")
+    args = parser.parse_args()
+
+    data = os.urandom(args.file_size)
+    for func in (bench_single, bench_transaction):
+        for durability in ("none", "data", "full"):
+            for tmpfile in (False, True):
+                with tempfile.TemporaryDirectory(dir=args.dir) as path:
+                    start = time.perf_counter()
+                    func(path, args.files, data, durability=durability, tmpfile=tmpfile)
+                    elapsed = time.perf_counter() - start
+                print(
+                    "{:>17} durability={:<4} tmpfile={:<5}: {:9.1f} files/s".format(
+                        func.__name__, durability, str(tmpfile), args.files / elapsed
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,53 +4,316 @@
 # SPDX-FileCopyrightText: © 2018 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import io
 import sys
 import os
+import queue
 import shlex
 import subprocess
+import tempfile
+import threading
 
 
 # SPDX-SnippetBegin
 # SPDX-SnippetName: auto_pager from rf-pymods
-# SPDX-SnippetComment: Revision 2026-05-14
+# SPDX-SnippetComment: Revision 2026-10-17
 # SPDX-SnippetComment: Originally from https://forge.colobox.com/rfinnie/rf-pymods
 # SPDX-SnippetCopyrightText: © 2018 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 class AutoPager:
+    """Send output to a pager if stdout is a TTY
+
+    buffer_size: Size of text to collect before writing it to the pager
+                 (or stdout) in one batch; 0 to write immediately
+    background: Write batches from a background thread
+    queue_size: Maximum number of batches queued for the background thread
+    full: What to do with a batch when the queue is full: "block" until
+          there is room, "drop" it, or "spill" it to a temporary file
+
+    Buffered text is written when buffer_size is reached, on flush(),
+    and on close().  A pager which is garbage collected without being
+    closed is closed then; with background=True, the writer thread
+    keeps the pager alive, so close() must be called.  A
+    BrokenPipeError or KeyboardInterrupt while writing closes the
+    pager, and further writes are ignored.
+
+    The pager is not started until the output no longer fits on one
+    screen (per os.get_terminal_size()); until then output is held, and
+    if the pager is closed before that happens, the output is written
+    directly to stdout without starting a pager.  flush() also writes
+    held output directly to stdout, and the pager is then started only
+    if the output as a whole no longer fits on one screen.
+
+    With background=True, batches are put in a bounded queue which a
+    writer thread drains into the pager, so a producer is not blocked
+    while the user is reading in the pager (except with full="block").
+    Dropped batches are counted in the dropped attribute (in
+    characters); spilled batches are written to the pager, in order,
+    once the queue has drained.  Any other exception in the writer
+    thread closes the pager and is raised from the next write() of a
+    batch, flush() or close().  awrite() is a coroutine version of
+    write() which does not block the event loop.
+    """
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
-    def __init__(self):
+    def __del__(self):
+        # Not set if __init__() failed
+        if not getattr(self, "closed", True):
+            self.close()
+
+    def __init__(self, buffer_size=io.DEFAULT_BUFFER_SIZE, background=False, queue_size=64, full="block"):
+        if full not in ("block", "drop", "spill"):
+            raise ValueError("Unknown full policy: {}".format(full))
         self.closed = False
         self.pager = None
+        self.buffer_size = buffer_size
+        self.full = full
+        self.dropped = 0
+        self._buffer = []
+        self._buffered = 0
+        self._deferred = False
+        self._queue = None
+        self._awrite_lock = None
+        if background:
+            self._queue = queue.Queue(queue_size)
+            self._broken = False
+            self._error = None
+            self._spill = None
+            self._spilling = False
+            self._spill_lock = threading.Lock()
+            self._thread = threading.Thread(target=self._writer, name="auto-pager-writer", daemon=True)
+            self._thread.start()
         if sys.stdout.isatty():
-            pager_cmd = ["pager"]
-            if os.environ.get("PAGER"):
-                pager_cmd = shlex.split(os.environ.get("PAGER"))
-            env = os.environ.copy()
-            if not os.environ.get("LESS"):
-                env.update({"LESS": "FRX"})
             try:
-                self.pager = subprocess.Popen(
-                    pager_cmd,
-                    stdin=subprocess.PIPE,
-                    stdout=sys.stdout,
-                    encoding="UTF-8",
-                    env=env,
-                )
-            except FileNotFoundError:
-                pass
+                self._columns, self._lines = os.get_terminal_size()
+            except OSError:
+                self._columns = self._lines = 0
+            if self._columns > 0 and self._lines > 0:
+                self._deferred = True
+                self._counted = 0
+                self._rows = 0
+                self._column = 0
+            else:
+                self._spawn()
+
+    def _spawn(self):
+        pager_cmd = ["pager"]
+        if os.environ.get("PAGER"):
+            pager_cmd = shlex.split(os.environ.get("PAGER"))
+        env = os.environ.copy()
+        if not os.environ.get("LESS"):
+            env.update({"LESS": "FRX"})
+        try:
+            self.pager = subprocess.Popen(
+                pager_cmd,
+                stdin=subprocess.PIPE,
+                stdout=sys.stdout,
+                encoding="UTF-8",
+                env=env,
+            )
+        except FileNotFoundError:
+            pass
+
+    def _fits_screen(self):
+        # Count the terminal rows used by text added since the last
+        # call, including wrapped lines
+        columns = self._columns
+        for text in self._buffer[self._counted :]:
+            parts = text.split("\n")
+            for part in parts[:-1]:
+                self._rows += max(-(-(self._column + len(part)) // columns), 1)
+                self._column = 0
+            self._column += len(parts[-1])
+        self._counted = len(self._buffer)
+        return self._rows - (-self._column // columns) < self._lines
+
+    def _writer(self):
+        while True:
+            data = self._queue.get()
+            try:
+                if data is not None:
+                    self._write_background(data)
+                # Spilled batches follow everything which was queued
+                # before the queue filled up
+                spill = None
+                with self._spill_lock:
+                    if self._spilling and self._queue.empty():
+                        # Producers spill to a new file from here on
+                        spill = self._spill
+                        self._spill = None
+                        self._spilling = False
+                if spill is not None:
+                    with spill:
+                        spill.seek(0)
+                        for chunk in iter(lambda: spill.read(65536), ""):
+                            self._write_background(chunk)
+            except Exception as e:
+                # Raised in the producer by close(), via the next
+                # write() or flush(); until then, batches are discarded
+                self._error = e
+                self._broken = True
+            finally:
+                self._queue.task_done()
+            if data is None:
+                return
+
+    def _write_background(self, data):
+        if self._broken:
+            return
+
+        fh = self.pager.stdin if self.pager else sys.stdout
+        try:
+            fh.write(data)
+        except BrokenPipeError:
+            # Picked up by the next write(), which closes the pager;
+            # until then, batches are discarded
+            self._broken = True
+
+    def _put(self, data):
+        if self.full == "block":
+            self._queue.put(data)
+            return
+
+        with self._spill_lock:
+            if self._spilling:
+                self._spill.write(data)
+                return
+            try:
+                self._queue.put_nowait(data)
+            except queue.Full:
+                if self.full == "drop":
+                    self.dropped += len(data)
+                    return
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile("w+", encoding="UTF-8")
+                self._spill.write(data)
+                self._spilling = True
 
     def write(self, line):
         if self.closed:
             return
 
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered >= self.buffer_size:
+            self._write()
+
+    def writelines(self, lines):
+        if self.closed:
+            return
+
+        buffer = self._buffer
+        buffer_size = self.buffer_size
+        buffered = self._buffered
+        for line in lines:
+            buffer.append(line)
+            buffered += len(line)
+            if buffered >= buffer_size:
+                self._write()
+                if self.closed:
+                    return
+                buffered = 0
+        self._buffered = buffered
+
+    async def awrite(self, line):
+        """Write without blocking the event loop
+
+        line: Text to write
+
+        Text is buffered as with write(); a batch which may block is
+        written in an executor, one batch at a time.
+        """
+        if self.closed:
+            return
+
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if self._buffered < self.buffer_size:
+            return
+        if self._awrite_lock is None:
+            # Created here, as before Python 3.10 a lock is bound to the
+            # event loop current at its creation
+            self._awrite_lock = asyncio.Lock()
+        # A batch which cannot block is queued directly, unless earlier
+        # batches are still waiting in the executor
+        if self._queue is not None and not self._awrite_lock.locked() and (self.full != "block" or not self._queue.full()):
+            self._write()
+            return
+
+        async with self._awrite_lock:
+            data = self._take()
+            if data is None:
+                return
+            write = self._output()
+            if write is None:
+                return
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, write, data)
+            except BrokenPipeError:
+                self.close()
+
+    def flush(self):
+        self._write(flush=True)
+        if self.closed:
+            return
+
         fh = self.pager.stdin if self.pager else sys.stdout
         try:
-            fh.write(line)
+            if self._queue is not None:
+                self._queue.join()
+                if self._broken:
+                    self.close()
+                    return
+            fh.flush()
+        except KeyboardInterrupt:
+            self.close()
+        except BrokenPipeError:
+            self.close()
+
+    def _take(self, flush=False):
+        # Take the buffered text as a batch, or None if there is
+        # nothing to write yet
+        if self.closed or not self._buffer:
+            return None
+        if self._deferred:
+            if not self._fits_screen():
+                self._deferred = False
+                self._spawn()
+            elif flush:
+                # Written directly, while rows are still being counted
+                self._counted = 0
+            else:
+                return None
+
+        data = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+        return data
+
+    def _output(self):
+        # Where to write a batch, or None if the pager was closed
+        if self._queue is None:
+            return (self.pager.stdin if self.pager else sys.stdout).write
+        if self._broken:
+            self.close()
+            return None
+        return self._put
+
+    def _write(self, flush=False):
+        data = self._take(flush)
+        if data is None:
+            return
+        write = self._output()
+        if write is None:
+            return
+        try:
+            write(data)
         except KeyboardInterrupt:
             self.close()
         except BrokenPipeError:
@@ -60,6 +323,18 @@ class AutoPager:
         if self.closed:
             return
 
+        self._deferred = False
+        self._write()
+        if self.closed:
+            return
+
+        error = None
+        if self._queue is not None:
+            self._queue.put(None)
+            # The writer thread has written (and closed) any spill file
+            self._thread.join()
+            error = self._error
+
         if self.pager:
             try:
                 self.pager.stdin.close()
@@ -73,6 +348,8 @@ class AutoPager:
                     pass
 
         self.closed = True
+        if error is not None:
+            raise error
 
 
 # SPDX-SnippetEnd
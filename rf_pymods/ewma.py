@@ -4,19 +4,26 @@
 # SPDX-FileCopyrightText: © 2021 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import array
+import heapq
+import math
+import operator
+import time
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
 
 # SPDX-SnippetBegin
 # SPDX-SnippetName: ewma from rf-pymods
-# SPDX-SnippetComment: Revision 2026-05-14
+# SPDX-SnippetComment: Revision 2026-10-17
 # SPDX-SnippetComment: Originally from https://forge.colobox.com/rfinnie/rf-pymods
 # SPDX-SnippetCopyrightText: © 2021 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
-class EWMA:
-    """Exponentially-weighted moving average
-
-    vals: Number, or list of numbers to add
-    weight: Moving average weight, default 8.0
-    """
+class _EWMABase:
+    """Interface shared by EWMA and EWMVariance"""
 
     average = 1.0
     weight = 8.0
@@ -37,6 +44,124 @@ class EWMA:
     def __int__(self):
         return int(self.average)
 
+    def append(self, vals):
+        self.add(vals)
+
+    def extend(self, vals):
+        self.add(vals)
+
+
+class EWMA(_EWMABase):
+    """Exponentially-weighted moving average
+
+    vals: Number, or list of numbers to add
+    weight: Moving average weight, default 8.0
+
+    If NumPy is available (it is optional), array.array, memoryview
+    and NumPy array inputs are added in bulk, using the vectorized
+    closed form of the average over the whole input rather than
+    updating it per number.  The result is equivalent to adding each
+    number in turn within floating point error, to a relative tolerance
+    of about 1e-9.  Without NumPy, they are added per number.
+    """
+
+    bulk_chunk_size = 1048576
+
+    def add(self, vals):
+        """Add one or more numbers to the weighted average, in place
+
+        vals: Number, or list of numbers
+        """
+        if isinstance(vals, (int, float, complex)):
+            vals = [vals]
+        elif numpy is not None and (isinstance(vals, (array.array, memoryview)) or hasattr(vals, "__array_interface__")):
+            return self._add_bulk(vals)
+        a = 1 / self.weight
+        b = 1 - a
+        for number in vals:
+            self.average = a * number + b * self.average
+            self.items += 1
+            self.sum += number
+
+    def _add_bulk(self, vals):
+        # Adding n numbers x[0]..x[n-1] gives:
+        #   average = b**n * average + a * sum(b**(n-1-i) * x[i])
+        # where a = 1 / weight and b = 1 - a
+        a = 1 / self.weight
+        b = 1 - a
+        vals = numpy.asarray(vals).ravel()
+        for start in range(0, len(vals), self.bulk_chunk_size):
+            chunk = vals[start : start + self.bulk_chunk_size]
+            powers = b ** numpy.arange(len(chunk) - 1, -1, -1, dtype=float)
+            self.average = b ** len(chunk) * self.average + a * numpy.dot(powers, chunk).item()
+            self.items += len(chunk)
+            if chunk.dtype.kind in "iu":
+                # Sum integers exactly, as NumPy's fixed-width sum wraps
+                self.sum += sum(chunk.tolist())
+            else:
+                self.sum += numpy.sum(chunk).item()
+
+    def merge(self, other):
+        """Add the numbers summarized by another EWMA, in place
+
+        other: EWMA (or state tuple) covering numbers which follow this
+               one's, started from the default average
+
+        Adding n numbers is an affine map of the average, determined by
+        n and the weight, so partial averages of consecutive segments of
+        a stream (such as computed in parallel) can be merged in order
+        into the result of adding the whole stream, within floating
+        point error.  Returns self, so partials can be combined with
+        functools.reduce(EWMA.merge, partials).
+        """
+        if not isinstance(other, EWMA):
+            other = EWMA.from_state(other)
+        if other.weight != self.weight:
+            raise ValueError("Cannot merge EWMAs with different weights")
+        decay = (1 - (1 / self.weight)) ** other.items
+        self.average = decay * self.average + (other.average - decay * EWMA.average)
+        self.items += other.items
+        self.sum += other.sum
+        return self
+
+    def state(self):
+        """Return a compact (weight, items, sum, average) state tuple"""
+        return (self.weight, self.items, self.sum, self.average)
+
+    @classmethod
+    def from_state(cls, state):
+        """Create an EWMA from a state() tuple"""
+        ewma = cls(weight=state[0])
+        ewma.items, ewma.sum, ewma.average = state[1:]
+        return ewma
+
+
+class EWMVariance(_EWMABase):
+    """Exponentially-weighted moving average and variance
+
+    vals: Number, or list of numbers to add
+    weight: Moving average weight, default 8.0
+    quantiles: Quantiles to also estimate, with Quantile
+
+    The average is identical to EWMA's, with the exponentially-weighted
+    variance and standard deviation updated in the same single pass
+    (for complex numbers, the variance of their magnitude around the
+    average).  Estimators for any quantiles given (such as 0.99) are
+    updated by the same add() call, available in the quantiles dict;
+    with quantiles, adding a complex number raises TypeError.  Unlike
+    EWMA, it cannot be merged or saved as a state tuple.
+    """
+
+    variance = 0.0
+
+    def __init__(self, vals=None, weight=8.0, quantiles=()):
+        self.quantiles = {q: Quantile(q) for q in quantiles}
+        super().__init__(vals, weight)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
     def add(self, vals):
         """Add one or more numbers to the weighted average, in place
 
@@ -44,10 +169,123 @@ class EWMA:
         """
         if isinstance(vals, (int, float, complex)):
             vals = [vals]
+        a = 1 / self.weight
+        b = 1 - a
+        average = self.average
+        variance = self.variance
+        estimators = list(self.quantiles.values())
+        try:
+            for number in vals:
+                if estimators and isinstance(number, complex):
+                    raise TypeError("Cannot estimate quantiles of complex numbers")
+                diff = number - average
+                increment = a * diff
+                average += increment
+                variance = b * (variance + abs(diff) * abs(increment))
+                for estimator in estimators:
+                    estimator.add(number)
+                self.items += 1
+                self.sum += number
+        finally:
+            # Keep the numbers added before any error
+            self.average = average
+            self.variance = variance
+
+
+class Quantile:
+    """Streaming quantile estimator
+
+    q: Quantile to estimate, between 0 and 1 (0.99 for p99)
+    vals: Number, or list of numbers to add
+
+    Uses the P-square algorithm, which tracks five markers rather than
+    storing samples, so memory use is constant and each update is O(1).
+    The estimate is exact for up to five numbers, and approximate
+    afterward.
+    """
+
+    def __init__(self, q, vals=None):
+        if not 0 < q < 1:
+            raise ValueError("q must be between 0 and 1")
+        self.q = q
+        self.items = 0
+        self.sum = 0
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+        self._increments = [0, q / 2, q, (1 + q) / 2, 1]
+        if vals is not None:
+            self.add(vals)
+
+    def __len__(self):
+        return self.items
+
+    def __float__(self):
+        return self.value
+
+    def __int__(self):
+        return int(self.value)
+
+    @property
+    def value(self):
+        heights = self._heights
+        if self.items > 5:
+            return heights[2]
+        if not heights:
+            return 0.0
+        # Few enough numbers to interpolate exactly
+        rank = (len(heights) - 1) * self.q
+        lower = math.floor(rank)
+        upper = min(lower + 1, len(heights) - 1)
+        return heights[lower] + (heights[upper] - heights[lower]) * (rank - lower)
+
+    def add(self, vals):
+        """Add one or more numbers to the estimator, in place
+
+        vals: Number, or list of numbers
+        """
+        if isinstance(vals, (int, float)):
+            vals = [vals]
         for number in vals:
-            self.average = (1 / self.weight) * number + (1 - (1 / self.weight)) * self.average
             self.items += 1
             self.sum += number
+            if self.items <= 5:
+                self._heights.append(number)
+                self._heights.sort()
+                continue
+            self._update(number)
+
+    def _update(self, number):
+        heights = self._heights
+        positions = self._positions
+        desired = self._desired
+        if number < heights[0]:
+            heights[0] = number
+            k = 0
+        elif number >= heights[4]:
+            heights[4] = number
+            k = 3
+        else:
+            k = 0
+            while number >= heights[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            desired[i] += self._increments[i]
+        # Adjust the middle markers toward their desired positions
+        for i in range(1, 4):
+            d = desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+                    (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+                    + (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+                )
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
 
     def append(self, vals):
         self.add(vals)
@@ -56,4 +294,271 @@ class EWMA:
         self.add(vals)
 
 
+class RollingWindow:
+    """Moving average over a window of the most recent numbers
+
+    size: Number of numbers in the window
+    vals: Number, or list of numbers to add
+
+    Numbers are stored in a preallocated array ring buffer, and the sum
+    of the window is updated as numbers enter and leave it, so each
+    update is O(1).  The sum is recomputed from the buffer each time it
+    wraps around, so floating point error does not accumulate.  len()
+    is the number of numbers currently in the window; items is the
+    total number added.
+    """
+
+    def __init__(self, size, vals=None):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.items = 0
+        self.sum = 0.0
+        self._buffer = array.array("d", bytes(size * 8))
+        self._index = 0
+        if vals is not None:
+            self.add(vals)
+
+    def __len__(self):
+        return min(self.items, self.size)
+
+    def __float__(self):
+        return self.average
+
+    def __int__(self):
+        return int(self.average)
+
+    @property
+    def average(self):
+        if not self.items:
+            return 0.0
+        return self.sum / len(self)
+
+    def add(self, vals):
+        """Add one or more numbers to the window, in place
+
+        vals: Number, or list of numbers
+        """
+        if isinstance(vals, (int, float)):
+            vals = [vals]
+        buffer = self._buffer
+        size = self.size
+        for number in vals:
+            index = self._index
+            self.sum += number - buffer[index]
+            buffer[index] = number
+            self.items += 1
+            if index + 1 == size:
+                self._index = 0
+                self.sum = sum(buffer)
+            else:
+                self._index = index + 1
+
+    def append(self, vals):
+        self.add(vals)
+
+    def extend(self, vals):
+        self.add(vals)
+
+
+class TimeEWMA:
+    """Time-decayed exponentially-weighted moving average
+
+    half_life: Time after which a sample's weight has halved
+    vals: Iterable of (value, timestamp) pairs to add
+
+    Samples may arrive at irregular timestamps; each sample's weight
+    decays by half for every half_life elapsed, so gaps are accounted
+    for exactly.  Samples sharing a timestamp are weighted equally, and
+    a sample older than the latest one is added with its weight already
+    decayed.  The first sample becomes the average.
+    """
+
+    __slots__ = ("average", "half_life", "items", "sum", "timestamp", "_rate", "_total", "_weight")
+
+    def __init__(self, half_life, vals=None):
+        if half_life <= 0:
+            raise ValueError("half_life must be positive")
+        self.half_life = half_life
+        self.average = 0.0
+        self.items = 0
+        self.sum = 0
+        self.timestamp = None
+        self._rate = math.log(2) / half_life
+        self._total = 0.0
+        self._weight = 0.0
+        if vals is not None:
+            self.extend(vals)
+
+    def __len__(self):
+        return self.items
+
+    def __float__(self):
+        return self.average
+
+    def __int__(self):
+        return int(self.average)
+
+    def add(self, value, timestamp=None):
+        """Add a number to the weighted average, in place
+
+        value: Number
+        timestamp: Time of the sample, default time.monotonic()
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.timestamp is None or timestamp >= self.timestamp:
+            if self.timestamp is not None:
+                decay = math.exp(self._rate * (self.timestamp - timestamp))
+                self._total *= decay
+                self._weight *= decay
+            self._total += value
+            self._weight += 1.0
+            self.timestamp = timestamp
+        else:
+            decay = math.exp(self._rate * (timestamp - self.timestamp))
+            self._total += value * decay
+            self._weight += decay
+        self.average = self._total / self._weight
+        self.items += 1
+        self.sum += value
+
+    def append(self, value, timestamp=None):
+        self.add(value, timestamp)
+
+    def extend(self, vals):
+        """Add (value, timestamp) pairs to the weighted average, in place
+
+        vals: Iterable of (value, timestamp) pairs
+        """
+        for value, timestamp in vals:
+            self.add(value, timestamp)
+
+
+class EWMABank:
+    """Keyed collection of exponentially-weighted moving averages
+
+    weight: Moving average weight, default 8.0
+
+    Each key behaves like its own EWMA (starting from the same default
+    average), but averages, counts, sums and last update times are
+    stored in parallel arrays indexed by key, rather than as one object
+    per key.  Slots of removed keys are reused.
+    """
+
+    def __init__(self, weight=8.0):
+        self.weight = weight
+        self._index = {}
+        self._free = []
+        self._averages = array.array("d")
+        self._items = array.array("q")
+        self._sums = array.array("d")
+        self._updated = array.array("d")
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __getitem__(self, key):
+        return self._averages[self._index[key]]
+
+    def __delitem__(self, key):
+        self._free.append(self._index.pop(key))
+
+    def count(self, key):
+        """Return the number of values added for a key"""
+        return self._items[self._index[key]]
+
+    def sum(self, key):
+        """Return the sum of values added for a key"""
+        return self._sums[self._index[key]]
+
+    def add(self, key, value):
+        """Add a number to a key's weighted average, in place
+
+        key: Key
+        value: Number
+        """
+        self.update((key,), (value,))
+
+    def update(self, keys, values):
+        """Add numbers to multiple keys' weighted averages, in place
+
+        keys: Iterable of keys
+        values: Iterable of numbers, paired with keys
+        """
+        a = 1 / self.weight
+        b = 1 - a
+        index = self._index
+        averages = self._averages
+        items = self._items
+        sums = self._sums
+        updated = self._updated
+        now = time.monotonic()
+        for key, value in zip(keys, values):
+            slot = index.get(key)
+            if slot is None:
+                slot = index[key] = self._allocate()
+            averages[slot] = a * value + b * averages[slot]
+            items[slot] += 1
+            sums[slot] += value
+            updated[slot] = now
+
+    def _allocate(self):
+        if self._free:
+            slot = self._free.pop()
+            self._averages[slot] = EWMA.average
+            self._items[slot] = 0
+            self._sums[slot] = 0.0
+            return slot
+        self._averages.append(EWMA.average)
+        self._items.append(0)
+        self._sums.append(0.0)
+        self._updated.append(0.0)
+        return len(self._averages) - 1
+
+    def top(self, n, largest=True):
+        """Return the n (key, average) pairs with the largest averages
+
+        n: Number of pairs to return
+        largest: Return the smallest averages instead if False
+        """
+        averages = self._averages
+        pairs = ((key, averages[slot]) for key, slot in self._index.items())
+        if largest:
+            return heapq.nlargest(n, pairs, key=operator.itemgetter(1))
+        return heapq.nsmallest(n, pairs, key=operator.itemgetter(1))
+
+    def above(self, threshold):
+        """Return (key, average) pairs with averages above a threshold"""
+        averages = self._averages
+        return [(key, averages[slot]) for key, slot in self._index.items() if averages[slot] > threshold]
+
+    def below(self, threshold):
+        """Return (key, average) pairs with averages below a threshold"""
+        averages = self._averages
+        return [(key, averages[slot]) for key, slot in self._index.items() if averages[slot] < threshold]
+
+    def evict(self, max_idle, now=None):
+        """Remove keys which have not been updated recently
+
+        max_idle: Maximum time since a key's last update, in seconds
+        now: Current time.monotonic() value, default now
+
+        Returns a list of removed keys.
+        """
+        if now is None:
+            now = time.monotonic()
+        updated = self._updated
+        evicted = [key for key, slot in self._index.items() if now - updated[slot] > max_idle]
+        for key in evicted:
+            del self[key]
+        return evicted
+
+
 # SPDX-SnippetEnd
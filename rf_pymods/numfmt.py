@@ -4,13 +4,122 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import bisect
+import functools
+import itertools
+import numbers
+import operator
+import re
+import string
+
 
 # SPDX-SnippetBegin
 # SPDX-SnippetName: numfmt from rf-pymods
-# SPDX-SnippetComment: Revision 2026-05-14
+# SPDX-SnippetComment: Revision 2026-10-17
 # SPDX-SnippetComment: Originally from https://forge.colobox.com/rfinnie/rf-pymods
 # SPDX-SnippetCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
+class NumberFormat(float):
+    prefix = ""
+    fmt = "{num.real:0.02f} {num.prefix}"
+
+    def __str__(self):
+        return _compile(self.fmt)(self)
+
+    def __repr__(self):
+        return str(self)
+
+
+_PREFIXES = (
+    ("k", "Ki"),
+    ("M", "Mi"),
+    ("G", "Gi"),
+    ("T", "Ti"),
+    ("P", "Pi"),
+    ("E", "Ei"),
+    ("Z", "Zi"),
+    ("Y", "Yi"),
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(fmt):
+    # Rewrite e.g. "{num.real:0.02f} {num.prefix}" as "{0:0.02f} {1}"
+    # plus attrgetter("real", "prefix"), so the format string is only
+    # parsed once, and returns a function rendering a NumberFormat.
+    # Anything other than plain num.attribute fields is left to
+    # str.format().
+    def _render_named(num):
+        return fmt.format(num=num)
+
+    def _render_one(num):
+        return render(getter(num))
+
+    def _render_many(num):
+        return render(*getter(num))
+
+    template = []
+    paths = []
+    try:
+        parsed = list(string.Formatter().parse(fmt))
+    except ValueError:
+        return _render_named
+    for literal, field, spec, conversion in parsed:
+        template.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if not field.startswith("num.") or "[" in field or "{" in spec:
+            return _render_named
+        template.append("{{{}{}{}}}".format(len(paths), "!" + conversion if conversion else "", ":" + spec if spec else ""))
+        paths.append(field[4:])
+    if not paths:
+        return _render_named
+    render = "".join(template).format
+    getter = operator.attrgetter(*paths)
+    return _render_one if len(paths) == 1 else _render_many
+
+
+@functools.lru_cache(maxsize=64)
+def _thresholds(divisor, rollover, length):
+    # Smallest absolute input which rolls over to each prefix
+    return [divisor * rollover * divisor**i for i in range(length)]
+
+
+@functools.lru_cache(maxsize=64)
+def _formatter(fmt, binary, rollover, limit, prefixes):
+    if prefixes is None:
+        prefixes = _PREFIXES
+    names = [""] + [prefix[1] if binary else prefix[0] for prefix in prefixes]
+    divisor = 1024 if binary else 1000
+    if limit <= 0 or limit > len(prefixes):
+        limit = len(prefixes)
+    cutoff = divisor * rollover
+    thresholds = _thresholds(divisor, rollover, len(prefixes))
+
+    def _format(num):
+        is_negative = num < 0
+        num = abs(num)
+        count = min(bisect.bisect_right(thresholds, num), limit)
+        previous = num
+        for _ in range(count):
+            previous = num
+            num = num / float(divisor)
+        # Correct float rounding at a threshold, so the result matches
+        # dividing one prefix at a time
+        if count and previous < cutoff:
+            num = previous
+            count -= 1
+        elif count < limit and num >= cutoff:
+            num = num / float(divisor)
+            count += 1
+        ret = NumberFormat((0 - num) if is_negative else num)
+        ret.fmt = fmt
+        ret.prefix = names[count]
+        return ret
+
+    return _format
+
+
 def numfmt(
     num,
     fmt="{num.real:0.02f} {num.prefix}",
@@ -27,49 +136,203 @@ def numfmt(
     rollover: Threshold to roll over to the next prefix
     limit: Stop after a specified number of rollovers
     prefixes: List of (decimal, binary) prefix strings, ascending
+
+    The prefix tables for each combination of arguments, and the parsed
+    form of each format string, are cached in bounded LRU caches.
+    """
+    if prefixes is not None:
+        prefixes = tuple(map(tuple, prefixes))
+    return _formatter(fmt, binary, rollover, limit, prefixes)(num)
+
+
+def numfmt_many(
+    nums,
+    fmt="{num.real:0.02f} {num.prefix}",
+    binary=False,
+    rollover=1.0,
+    limit=0,
+    prefixes=None,
+):
+    """Formats a sequence of numbers with decimal or binary prefixes
+
+    nums: Iterable of input numbers, such as a list or array
+    Other arguments are as accepted by numfmt().
+
+    Returns a list of numfmt() results, with the prefix tables set up
+    once for the whole sequence.
     """
+    if prefixes is not None:
+        prefixes = tuple(map(tuple, prefixes))
+    return list(map(_formatter(fmt, binary, rollover, limit, prefixes), nums))
 
-    class NumberFormat(float):
-        prefix = ""
-        fmt = "{num.real:0.02f} {num.prefix}"
 
-        def __str__(self):
-            return self.fmt.format(num=self)
+def numfmt_table(
+    rows,
+    sample=100,
+    sep="  ",
+    fmt="{num.real:0.02f} {num.prefix}",
+    binary=False,
+    rollover=1.0,
+    limit=0,
+    prefixes=None,
+):
+    """Formats rows of numbers into aligned columns, lazily
 
-        def __repr__(self):
-            return str(self)
+    rows: Iterable of rows, each a sequence of cells
+    sample: Number of leading rows used to choose each column's prefix
+            and width, or None to use all rows
+    sep: Column separator
+    Other arguments are as accepted by numfmt().
 
+    Yields lines (without newlines) as rows are consumed, holding only
+    the sampled rows in memory.  Real number cells (int, float, NumPy
+    scalars and so on, but not bool) are formatted with one prefix per
+    column, the one numfmt() would choose for the largest number in
+    the sampled rows, and are right-aligned; other cells (such as a
+    header row) are left-aligned as str().  A later
+    cell wider than its column widens the column from that row on.
+    """
     if prefixes is None:
-        prefixes = [
-            ("k", "Ki"),
-            ("M", "Mi"),
-            ("G", "Gi"),
-            ("T", "Ti"),
-            ("P", "Pi"),
-            ("E", "Ei"),
-            ("Z", "Zi"),
-            ("Y", "Yi"),
-        ]
+        prefixes = _PREFIXES
+    names = [""] + [prefix[1] if binary else prefix[0] for prefix in prefixes]
     divisor = 1024 if binary else 1000
     if limit <= 0 or limit > len(prefixes):
         limit = len(prefixes)
+    thresholds = _thresholds(divisor, rollover, len(prefixes))
+    render = _compile(fmt)
+    columns = []
+    widths = []
+
+    def _add_column(maximum):
+        count = min(bisect.bisect_right(thresholds, maximum), limit)
+        columns.append((float(divisor) ** count, names[count]))
+        widths.append(0)
+
+    def _format(row):
+        cells = []
+        for i, cell in enumerate(row):
+            if isinstance(cell, numbers.Real) and not isinstance(cell, bool):
+                if i >= len(columns):
+                    _add_column(abs(cell))
+                scale, prefix = columns[i]
+                num = NumberFormat(cell / scale)
+                num.prefix = prefix
+                cells.append((render(num), True))
+            else:
+                if i >= len(columns):
+                    _add_column(0)
+                cells.append((str(cell), False))
+        return cells
+
+    def _line(cells):
+        out = []
+        for i, (text, numeric) in enumerate(cells):
+            if len(text) > widths[i]:
+                widths[i] = len(text)
+            out.append(text.rjust(widths[i]) if numeric else text.ljust(widths[i]))
+        return sep.join(out).rstrip()
+
+    rows = iter(rows)
+    head = list(rows if sample is None else itertools.islice(rows, sample))
+    maxima = []
+    for row in head:
+        for i, cell in enumerate(row):
+            if i >= len(maxima):
+                maxima.append(0)
+            if isinstance(cell, numbers.Real) and not isinstance(cell, bool) and abs(cell) > maxima[i]:
+                maxima[i] = abs(cell)
+    for maximum in maxima:
+        _add_column(maximum)
+    head = [_format(row) for row in head]
+    for cells in head:
+        for i, (text, numeric) in enumerate(cells):
+            widths[i] = max(widths[i], len(text))
+    for cells in head:
+        yield _line(cells)
+    del head
+    for row in rows:
+        yield _line(_format(row))
+
+
+_NUMBER_RE = re.compile(r"\s*([-+]?(?:(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?|inf|nan))\s*(.*?)\s*$")
+_UNIT_RE = re.compile(r"(?:[^\W\d_]|/)*")
+# Units accepted without a prefix
+_UNITS = frozenset(("B", "b", "/s", "B/s", "b/s"))
 
-    is_negative = num < 0
-    num = abs(num)
-    count = 0
-    p = ""
-    for prefix in prefixes:
-        if num < (divisor * rollover):
-            break
-        if count >= limit:
-            break
-        count += 1
-        num = num / float(divisor)
-        p = prefix[1] if binary else prefix[0]
-    ret = NumberFormat((0 - num) if is_negative else num)
-    ret.fmt = fmt
-    ret.prefix = p
-    return ret
+
+@functools.lru_cache(maxsize=64)
+def _parser(binary, prefixes):
+    if prefixes is None:
+        prefixes = _PREFIXES
+    multipliers = {}
+    for i, (decimal, iec) in enumerate(prefixes, 1):
+        multipliers[iec] = 1024**i
+        # Accept e.g. "K" (as output by du/df) as well as "k"
+        for name in (decimal.upper(), decimal):
+            multipliers[name] = (1024 if binary else 1000) ** i
+    # Also accept e.g. "1.2g" (as output by top)
+    folded = {name.lower(): multiplier for name, multiplier in multipliers.items()}
+    lengths = sorted({len(name) for name in multipliers}, reverse=True)
+    match = _NUMBER_RE.match
+    unit_match = _UNIT_RE.fullmatch
+
+    def _parse(text):
+        m = match(text)
+        if m is None:
+            raise ValueError("Cannot parse number: {!r}".format(text))
+        num = float(m.group(1))
+        rest = m.group(2)
+        if not rest:
+            return num
+        for length in lengths:
+            head = rest[:length]
+            multiplier = multipliers.get(head)
+            if multiplier is None:
+                multiplier = folded.get(head.lower())
+            if multiplier is not None:
+                if unit_match(rest[length:]) is None:
+                    break
+                return num * multiplier
+        if rest in _UNITS:
+            return num
+        raise ValueError("Cannot parse number: {!r}".format(text))
+
+    return _parse
+
+
+def numparse(text, binary=False, prefixes=None):
+    """Parses a number with decimal or binary prefixes
+
+    text: Input string, such as "12.35 k" or "12.06 KiB"
+    binary: If True, decimal prefixes (k, M, ...) multiply by 1024,
+            as with du/df output
+    prefixes: List of (decimal, binary) prefix strings, ascending
+
+    The inverse of numfmt().  IEC binary prefixes (Ki, Mi, ...) always
+    multiply by 1024.  Prefixes are matched exactly if possible, then
+    ignoring case (as with top's "1.2g").  A prefix may be followed by
+    a unit made of letters and "/" (such as "B" or "B/s"), which is
+    ignored; without a prefix, only the units "B", "b", "/s", "B/s"
+    and "b/s" are accepted.  Raises ValueError if text is not a number,
+    optionally followed by a prefix and unit.
+    """
+    if prefixes is not None:
+        prefixes = tuple(map(tuple, prefixes))
+    return _parser(binary, prefixes)(text)
+
+
+def numparse_many(texts, binary=False, prefixes=None):
+    """Parses a sequence of numbers with decimal or binary prefixes
+
+    texts: Iterable of input strings, such as a column of a table
+    Other arguments are as accepted by numparse().
+
+    Returns a list of numparse() results, with the prefix lookup set up
+    once for the whole sequence.
+    """
+    if prefixes is not None:
+        prefixes = tuple(map(tuple, prefixes))
+    return list(map(_parser(binary, prefixes), texts))
 
 
 # SPDX-SnippetEnd
@@ -4,18 +4,326 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import inspect
+import io
 import itertools
+import mmap
+import os
+import queue
+import stat
+import threading
+import time
 
 
 # SPDX-SnippetBegin
 # SPDX-SnippetName: readiter from rf-pymods
-# SPDX-SnippetComment: Revision 2026-05-14
+# SPDX-SnippetComment: Revision 2026-10-17
 # SPDX-SnippetComment: Originally from https://forge.colobox.com/rfinnie/rf-pymods
 # SPDX-SnippetCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
-def readiter(fh, size=1024):
-    """Iterate over a filehandle read()"""
-    return itertools.takewhile(lambda t: t, map(lambda chunk: fh.read(size), itertools.count(0)))
+def readiter(fh, size=1024, method="read", buffers=1, prefetch=0, max_size=4194304, dontneed=False):
+    """Iterate over a filehandle read()
+
+    fh: Filehandle
+    size: Maximum size of each block, or "auto"
+    method: "read" (new object per block), "readinto" (reused buffers)
+            or "mmap" (memory-mapped file)
+    buffers: Number of rotating buffers to use with "readinto"
+    prefetch: Number of blocks to read ahead in a background thread
+    max_size: Maximum block size with size="auto"
+    dontneed: Drop consumed ranges from the page cache
+
+    With method="readinto", blocks are read into preallocated
+    bytearrays and yielded as memoryview slices, avoiding an allocation
+    per block.  A yielded block is only valid until its buffer is
+    reused, i.e. after the iterator has advanced `buffers` more times;
+    copy it (bytes(block)) if it needs to live longer.  Filehandles
+    without readinto() (such as text mode handles) fall back to
+    "read".
+
+    With method="mmap", a binary filehandle to a regular file is
+    memory-mapped read-only and memoryview windows into the mapping are
+    yielded, starting from the current file position.  No read calls
+    are made; data comes straight from the page cache.  When iteration
+    ends (including stopping early), the filehandle is positioned after
+    the last yielded block and the mapping is released once no yielded
+    blocks remain referenced.  Pipes, sockets, text mode handles and
+    other non-regular files fall back to "read".
+
+    With prefetch set above 0, blocks are read by a background thread
+    into a queue holding up to `prefetch` blocks, so the next block can
+    be read while the current one is being processed.  This mainly
+    benefits consumers which release the GIL while processing (such as
+    hashlib).  Exceptions raised while reading are re-raised in the
+    consumer.  When iteration is stopped early, the thread is stopped
+    after its current read completes.  With "readinto", prefetch + 1
+    buffers are allocated in addition to `buffers` (for the queued
+    blocks and the block being read), so a yielded block stays valid
+    for the same number of advances as without prefetch.
+
+    With size="auto", blocks start at the file's preferred I/O size
+    (st_blksize) and double while measured read throughput keeps
+    improving, up to max_size.  The kernel is also advised that the
+    file will be read sequentially (posix_fadvise()/madvise()).  With
+    dontneed=True, ranges of binary regular files which have been
+    consumed are dropped from the page cache, so a one-pass scan of a
+    large file does not evict other cached data.
+    """
+
+    def _fstat():
+        try:
+            return os.fstat(fh.fileno())
+        except (AttributeError, OSError):
+            return None
+
+    def _readinto():
+        for view in itertools.cycle([memoryview(bytearray(size)) for _ in range(buffers)]):
+            length = fh.readinto(view)
+            if not length:
+                return
+            yield view[:length]
+
+    def _readinto_autosize():
+        views = itertools.cycle([memoryview(bytearray(max_size)) for _ in range(buffers)])
+
+        def _read(length):
+            view = next(views)
+            return view[: fh.readinto(view[:length]) or 0]
+
+        return _autosize(_read)
+
+    def _autosize(read):
+        blocksize = best_size = size
+        best_rate = 0.0
+        growing = True
+        while True:
+            start = time.perf_counter()
+            block = read(blocksize)
+            elapsed = time.perf_counter() - start
+            if not block:
+                return
+            if growing and len(block) == blocksize:
+                rate = blocksize / elapsed if elapsed > 0 else float("inf")
+                if rate < best_rate:
+                    # Throughput dropped; settle on the previous size
+                    blocksize = best_size
+                    growing = False
+                elif blocksize >= max_size:
+                    growing = False
+                else:
+                    best_size, best_rate = blocksize, rate
+                    blocksize = min(blocksize * 2, max_size)
+            yield block
+
+    def _mappable():
+        if isinstance(fh, io.TextIOBase):
+            return False
+        # Empty files cannot be mapped
+        return regular and st.st_size > 0
+
+    def _mmap():
+        mapping = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if autosize and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapping)
+        offset = fh.tell()
+        try:
+            while offset < len(view):
+                block = view[offset : offset + size]
+                offset += len(block)
+                yield block
+        finally:
+            fh.seek(offset)
+            view.release()
+            try:
+                mapping.close()
+            except BufferError:
+                # Yielded blocks are still referenced; the mapping will
+                # be released when they are garbage collected
+                pass
+
+    def _prefetch(blocks):
+        blockqueue = queue.Queue(prefetch)
+        stop = threading.Event()
+
+        def _worker():
+            try:
+                for block in blocks:
+                    blockqueue.put((block, None))
+                    if stop.is_set():
+                        return
+                blockqueue.put((None, None))
+            except Exception as e:
+                blockqueue.put((None, e))
+            finally:
+                if hasattr(blocks, "close"):
+                    blocks.close()
+
+        thread = threading.Thread(target=_worker, name="readiter-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                block, exception = blockqueue.get()
+                if exception is not None:
+                    raise exception
+                if block is None:
+                    return
+                yield block
+        finally:
+            stop.set()
+            # Drain the queue so a worker blocked on put() can notice
+            # the stop request
+            while thread.is_alive():
+                try:
+                    blockqueue.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def _dontneed(blocks):
+        fd = fh.fileno()
+        start = offset = fh.tell()
+        for block in blocks:
+            yield block
+            offset += len(block)
+            os.posix_fadvise(fd, start, offset - start, os.POSIX_FADV_DONTNEED)
+            # Partial pages are not dropped, so start the next range at
+            # the page containing the current offset
+            start = offset - (offset % mmap.PAGESIZE)
+
+    if method not in ("read", "readinto", "mmap"):
+        raise ValueError("Unknown method: {}".format(method))
+    if buffers < 1:
+        raise ValueError("buffers must be at least 1")
+    if prefetch > 0:
+        buffers += prefetch + 1
+    st = _fstat() if size == "auto" or method == "mmap" or dontneed else None
+    regular = st is not None and stat.S_ISREG(st.st_mode)
+    autosize = size == "auto"
+    if autosize:
+        size = min(getattr(st, "st_blksize", 0) or io.DEFAULT_BUFFER_SIZE, max_size)
+        if regular and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    if method == "readinto" and hasattr(fh, "readinto"):
+        blocks = _readinto_autosize() if autosize else _readinto()
+    elif method == "mmap" and _mappable():
+        if autosize:
+            size = max_size
+        blocks = _mmap()
+    elif autosize:
+        blocks = _autosize(fh.read)
+    else:
+        blocks = itertools.takewhile(lambda t: t, map(lambda chunk: fh.read(size), itertools.count(0)))
+    if prefetch > 0:
+        blocks = _prefetch(blocks)
+    if dontneed and regular and not isinstance(fh, io.TextIOBase) and hasattr(os, "posix_fadvise"):
+        blocks = _dontneed(blocks)
+    return blocks
+
+
+def readrecords(fh, delimiter=None, size=65536, max_length=None, **kwargs):
+    """Iterate over delimited records in a filehandle
+
+    fh: Filehandle
+    delimiter: Record delimiter, default newline (of the data's type)
+    size: Size of each block read
+    max_length: Maximum record length, raising ValueError if exceeded
+    kwargs: Additional arguments to pass to readiter()
+
+    Records are yielded without their delimiter, and are reassembled
+    across block boundaries (including delimiters which straddle two
+    blocks).  As with str.splitlines(), a trailing delimiter does not
+    produce an empty final record.  Each block is split in bulk with
+    split(), and memory use is bounded by size plus max_length.
+    """
+    parts = []
+    length = 0
+    tail = None
+    for block in readiter(fh, size=size, **kwargs):
+        if isinstance(block, memoryview):
+            block = bytes(block)
+        if tail is None:
+            if delimiter is None:
+                delimiter = "\n" if isinstance(block, str) else b"\n"
+            tail = block[:0]
+        buf = tail + block
+        if delimiter in buf:
+            records = buf.split(delimiter)
+            buf = records.pop()
+            if parts:
+                records[0] = buf[:0].join(parts) + records[0]
+                parts = []
+                length = 0
+            if max_length is not None and max(map(len, records)) > max_length:
+                raise ValueError("Record exceeds max_length of {}".format(max_length))
+            yield from records
+        # Hold back enough of the incomplete record to match a delimiter
+        # straddling this block and the next
+        cut = max(len(buf) - len(delimiter) + 1, 0)
+        if cut:
+            parts.append(buf[:cut])
+            length += cut
+        tail = buf[cut:]
+        if max_length is not None and length + len(tail) > max_length:
+            raise ValueError("Record exceeds max_length of {}".format(max_length))
+    if parts or tail:
+        yield tail[:0].join(parts) + tail
+
+
+async def areaditer(fh, size=1024):
+    """Asynchronously iterate over a filehandle read()
+
+    fh: asyncio.StreamReader, file descriptor or filehandle
+    size: Maximum size of each block, or "auto" (the file's preferred
+          I/O size, st_blksize)
+
+    Objects with a coroutine read() (such as asyncio.StreamReader) are
+    awaited directly.  Non-blocking file descriptors are read when the
+    event loop reports them as readable.  Blocking file descriptors and
+    filehandles are read in the event loop's default executor, so a
+    slow read does not stall the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if size == "auto":
+        try:
+            size = os.fstat(fh if isinstance(fh, int) else fh.fileno()).st_blksize
+        except (AttributeError, OSError):
+            size = 0
+        size = size or io.DEFAULT_BUFFER_SIZE
+
+    async def _read_stream():
+        return await fh.read(size)
+
+    async def _read_nonblocking():
+        while True:
+            try:
+                return os.read(fh, size)
+            except BlockingIOError:
+                pass
+            readable = loop.create_future()
+            loop.add_reader(fh, lambda: readable.done() or readable.set_result(None))
+            try:
+                await readable
+            finally:
+                loop.remove_reader(fh)
+
+    async def _read_blocking():
+        if isinstance(fh, int):
+            return await loop.run_in_executor(None, os.read, fh, size)
+        return await loop.run_in_executor(None, fh.read, size)
+
+    if inspect.iscoroutinefunction(getattr(fh, "read", None)):
+        read = _read_stream
+    elif isinstance(fh, int) and not os.get_blocking(fh):
+        read = _read_nonblocking
+    else:
+        read = _read_blocking
+    while True:
+        block = await read()
+        if not block:
+            return
+        yield block
 
 
 # SPDX-SnippetEnd
@@ -4,17 +4,136 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import concurrent.futures
+import io
 import os
 import shutil
+import sys
+import threading
 import uuid
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 
 # SPDX-SnippetBegin
 # SPDX-SnippetName: safe_write from rf-pymods
-# SPDX-SnippetComment: Revision 2026-05-14
+# SPDX-SnippetComment: Revision 2026-10-17
 # SPDX-SnippetComment: Originally from https://forge.colobox.com/rfinnie/rf-pymods
 # SPDX-SnippetCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _discard(future):
+    # Failed commits are kept for flush_all() to report
+    if future.cancelled() or future.exception() is None:
+        with _executor_lock:
+            _pending.discard(future)
+
+
+def _submit(func):
+    """Run a function in the shared background commit executor"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="safe_write")
+        future = _executor.submit(func)
+        _pending.add(future)
+    future.add_done_callback(_discard)
+    return future
+
+
+def flush_all():
+    """Wait for all outstanding background safe_write() commits
+
+    If any of the commits failed, including commits which finished
+    before flush_all() was called, the first exception is raised after
+    all commits have finished.  Each failure is reported once.
+    """
+    with _executor_lock:
+        futures = list(_pending)
+    concurrent.futures.wait(futures)
+    with _executor_lock:
+        _pending.difference_update(futures)
+    for future in futures:
+        if future.exception() is not None:
+            raise future.exception()
+
+
+def _fsync_dir(path):
+    """fsync() a directory, making renames within it durable"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _same_file(file1, file2):
+    """Compare two files' contents, ownership and permissions"""
+    try:
+        st1 = os.stat(file1)
+        st2 = os.stat(file2)
+    except FileNotFoundError:
+        return False
+    if (st1.st_size, st1.st_mode, st1.st_uid, st1.st_gid) != (st2.st_size, st2.st_mode, st2.st_uid, st2.st_gid):
+        return False
+    with open(file1, "rb") as fh1, open(file2, "rb") as fh2:
+        while True:
+            block = fh1.read(1048576)
+            if block != fh2.read(1048576):
+                return False
+            if not block:
+                return True
+
+
+def _copy_fd(src_fd, dst_fd):
+    """Copy the contents of one file to another, as cheaply as possible
+
+    Tries a FICLONE reflink, then copy_file_range(), then sendfile(),
+    then falls back to a normal copy.  Each method continues from where
+    the previous one stopped.  File positions are not used.
+    """
+    if fcntl is not None and sys.platform == "linux":
+        try:
+            fcntl.ioctl(dst_fd, getattr(fcntl, "FICLONE", 0x40049409), src_fd)
+            return
+        except OSError:
+            pass
+    size = os.fstat(src_fd).st_size
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+                if not copied:
+                    break
+                offset += copied
+        except OSError:
+            pass
+    if hasattr(os, "sendfile") and offset < size:
+        try:
+            # sendfile() writes at the current destination position
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if not sent:
+                    break
+                offset += sent
+        except OSError:
+            pass
+    while offset < size:
+        block = os.pread(src_fd, min(size - offset, 1048576), offset)
+        if not block:
+            break
+        offset += os.pwrite(dst_fd, block, offset)
+
+
 def safe_write(file, **kwargs):
     """(Try to) safely write files with minimum collision possibility
 
@@ -36,29 +155,331 @@ def safe_write(file, **kwargs):
         with safe_write("foo") as f:
             os.fchmod(f.fileno(), 0o0600)
             os.fchown(f.fileno(), 1000, 1000)
+
+    durability controls what is synced to disk upon close:
+
+        "none": Nothing is explicitly synced (default)
+        "data": The file data is fdatasync()ed before the move
+        "full": The file is fsync()ed before the move, and its
+                directory is fsync()ed after
+
+    With tmpfile=True on Linux, the temporary file is created with
+    O_TMPFILE, so it has no name until it is linked into place upon
+    close, and a crash will not leave temporary files behind.  The
+    filehandle's name will be its file descriptor while open.  If
+    O_TMPFILE is not supported, a named temporary file is used.
+
+    With populate=True, if the file exists beforehand, its contents are
+    copied into the temporary file upon open, and the filehandle is
+    positioned at the beginning.  This allows for modifying part of a
+    large file by seeking and writing, before the result is moved into
+    place.  Where supported, the copy is a reflink (FICLONE) which
+    shares data blocks with the original, so the cost is proportional
+    to the changed data; otherwise copy_file_range(), sendfile() or a
+    normal copy are used.
+
+        with safe_write("foo", mode="xb", populate=True) as f:
+            f.seek(1048576)
+            f.write(b"bar")
+
+    With background=True, close (or __exit__) hands the commit (syncing,
+    closing and moving into place) to a shared thread pool, and close()
+    returns a concurrent.futures.Future for it.  Any exception during
+    the commit is raised from the future's result(), and the temporary
+    file is removed.  flush_all() waits for all outstanding background
+    commits, e.g. before shutdown, and raises any commit errors which
+    have not been reported by it yet, so errors are not lost when the
+    future is discarded (as by __exit__).
+
+        f = safe_write("foo", durability="full", background=True)
+        f.write("bar")
+        future = f.close()
+        ...
+        future.result()
+
+    size_hint gives the expected size of a file written sequentially.
+    The temporary file is preallocated to that size with
+    posix_fallocate(), reducing fragmentation and metadata updates as
+    it grows, and is truncated to the end of the written data upon
+    close, including when seeking back to rewrite earlier parts (e.g.
+    a header).  Seeking relative to the end (os.SEEK_END) is relative
+    to the end of the written data, not the preallocated size.  It
+    cannot be used with populate.  For binary files, size_hint also
+    raises the default write buffer size (up to 1 MiB); the buffer
+    size can be set explicitly with open()'s buffering argument, which
+    is passed through as with all other arguments.
+
+        with safe_write("foo.tar", mode="xb", size_hint=2**30) as f:
+            ...
+
+    With skip_unchanged=True, the temporary file is compared against
+    the existing file upon close; first by size, ownership and
+    permissions, then by contents.  If they are identical, the
+    temporary file is removed instead of being moved into place, so the
+    existing file (and its inode and modification time) is untouched.
+    Either way, the filehandle's committed attribute is set to whether
+    the file was moved into place, and background commits' futures
+    return it as their result.
     """
 
+    def _sw_finish(fh):
+        nonlocal finished, unchanged
+        if finished:
+            return
+        finished = True
+        if anonymous or durability != "none" or size_hint or skip_unchanged:
+            fh.flush()
+        if size_hint:
+            # Release any preallocated space beyond what was written
+            os.ftruncate(fh.fileno(), _sw_data_end(os.lseek(fh.fileno(), 0, os.SEEK_CUR)))
+        if skip_unchanged:
+            unchanged = _same_file(temp_name, fh.dest_name)
+        if unchanged:
+            pass
+        elif durability == "data" and hasattr(os, "fdatasync"):
+            os.fdatasync(fh.fileno())
+        elif durability != "none":
+            os.fsync(fh.fileno())
+        if not anonymous:
+            fh._fh_close()
+
+    def _sw_rename(fh):
+        if unchanged:
+            fh._sw_abort()
+            setattr(fh, "committed", False)
+            return
+        if anonymous:
+            # An anonymous file cannot be linked over an existing file,
+            # so link it to a temporary name and then move that
+            directory = os.path.dirname(os.path.abspath(fh.dest_name))
+            link_name = "{}.tmp{}~".format(os.path.basename(fh.dest_name), str(uuid.uuid4()))
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                # Passing dst_dir_fd makes os.link() use linkat() with
+                # AT_SYMLINK_FOLLOW, needed to link the /proc entry
+                os.link(temp_name, link_name, dst_dir_fd=dir_fd)
+                try:
+                    os.rename(os.path.join(directory, link_name), fh.dest_name)
+                except BaseException:
+                    os.unlink(os.path.join(directory, link_name))
+                    raise
+            finally:
+                os.close(dir_fd)
+                fh._fh_close()
+        else:
+            os.rename(temp_name, fh.dest_name)
+        setattr(fh, "committed", True)
+        try:
+            setattr(fh, "name", fh.dest_name)
+        except AttributeError:
+            # Real file objects do not allow their name to be changed
+            pass
+
+    def _sw_data_end(pos):
+        # The preallocated file size says nothing about what was
+        # written.  Moving away from the position left by the last seek
+        # or truncate means data was written up to the current position.
+        if pos == moved_to:
+            return data_end
+        return max(data_end, pos)
+
+    def _sw_seek(fh, offset, whence=os.SEEK_SET):
+        nonlocal data_end, moved_to
+        data_end = _sw_data_end(fh.tell())
+        if whence == os.SEEK_END:
+            offset, whence = data_end + offset, os.SEEK_SET
+        moved_to = fh._fh_seek(offset, whence)
+        return moved_to
+
+    def _sw_truncate(fh, *args):
+        nonlocal data_end, moved_to
+        data_end = fh._fh_truncate(*args)
+        moved_to = fh.tell()
+        return data_end
+
+    def _sw_abort(fh):
+        try:
+            fh._fh_close()
+        finally:
+            if not anonymous:
+                try:
+                    os.unlink(temp_name)
+                except FileNotFoundError:
+                    pass
+
+    def _sw_commit(fh):
+        fh._sw_finish()
+        fh._sw_rename()
+        if durability == "full" and fh.committed:
+            _fsync_dir(os.path.dirname(os.path.abspath(fh.dest_name)))
+        return fh.committed
+
+    def _sw_background_commit(fh):
+        try:
+            return _sw_commit(fh)
+        except BaseException:
+            # Nothing else is left to clean up after a background commit
+            fh._sw_abort()
+            raise
+
     def _sw_close(fh):
+        nonlocal future
+        if future is not None:
+            return future
         if fh.closed:
             return
-        fh._fh_close()
-        os.rename(fh.name, fh.dest_name)
-        setattr(fh, "name", fh.dest_name)
+        if background:
+            future = _submit(lambda: _sw_background_commit(fh))
+            return future
+        _sw_commit(fh)
 
     preserve_stats = True
     if "preserve_stats" in kwargs:
         preserve_stats = bool(kwargs["preserve_stats"])
         del kwargs["preserve_stats"]
+    durability = kwargs.pop("durability", "none")
+    if durability not in ("none", "data", "full"):
+        raise ValueError("Unknown durability: {}".format(durability))
+    tmpfile = kwargs.pop("tmpfile", False)
+    populate = kwargs.pop("populate", False)
+    background = kwargs.pop("background", False)
+    size_hint = kwargs.pop("size_hint", 0)
+    skip_unchanged = kwargs.pop("skip_unchanged", False)
+    unchanged = False
+    if size_hint and populate:
+        raise ValueError("size_hint cannot be used with populate")
+    future = None
     if "mode" not in kwargs:
         kwargs["mode"] = "x"
-    temp_name = "{}.tmp{}~".format(file, str(uuid.uuid4()))
-    fh = open(temp_name, **kwargs)
+    if size_hint and "b" in kwargs["mode"] and "buffering" not in kwargs:
+        kwargs["buffering"] = min(max(size_hint, io.DEFAULT_BUFFER_SIZE), 1048576)
+    fh = None
+    anonymous = False
+    finished = False
+    data_end = 0
+    moved_to = 0
+    if tmpfile and hasattr(os, "O_TMPFILE"):
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(file)), os.O_TMPFILE | os.O_RDWR, 0o666)
+        except OSError:
+            # Not supported by the filesystem; fall back to a named file
+            pass
+        else:
+            anonymous = True
+            temp_name = "/proc/self/fd/{}".format(fd)
+            # O_TMPFILE files are always new, and "x" cannot be used
+            # with a file descriptor
+            kwargs["mode"] = kwargs["mode"].replace("x", "w")
+            fh = open(fd, **kwargs)
+    if fh is None:
+        temp_name = "{}.tmp{}~".format(file, str(uuid.uuid4()))
+        fh = open(temp_name, **kwargs)
     if preserve_stats and os.path.exists(file):
         shutil.copystat(file, temp_name)
     setattr(fh, "dest_name", file)
     setattr(fh, "_fh_close", fh.close)
+    setattr(fh, "_sw_finish", lambda: _sw_finish(fh))
+    setattr(fh, "_sw_rename", lambda: _sw_rename(fh))
+    setattr(fh, "_sw_abort", lambda: _sw_abort(fh))
     setattr(fh, "close", lambda: _sw_close(fh))
+    if size_hint:
+        setattr(fh, "_fh_seek", fh.seek)
+        setattr(fh, "_fh_truncate", fh.truncate)
+        setattr(fh, "seek", lambda *args, **kwargs: _sw_seek(fh, *args, **kwargs))
+        setattr(fh, "truncate", lambda *args: _sw_truncate(fh, *args))
+    if size_hint and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fh.fileno(), 0, size_hint)
+        except OSError:
+            # Preallocation is only an optimization
+            pass
+    if populate:
+        try:
+            src_fd = os.open(file, os.O_RDONLY)
+        except FileNotFoundError:
+            return fh
+        try:
+            _copy_fd(src_fd, fh.fileno())
+            fh.seek(0)
+        except BaseException:
+            fh._sw_abort()
+            raise
+        finally:
+            os.close(src_fd)
     return fh
 
 
+class SafeWriteTransaction:
+    """Write multiple files with safe_write(), committing them together
+
+    Filehandles are opened with open(), which takes the same arguments
+    as safe_write().  Closing an individual filehandle does not move it
+    into place; instead, commit() (or a successful __exit__) closes all
+    filehandles, moves them all into place, and then fsyncs each
+    directory involved once, rather than once per file (including
+    with durability="full").
+
+    If an exception occurs within the context, or any filehandle fails
+    to close, rollback() removes all temporary files and none of the
+    destination files are touched.  Note that the moves themselves are
+    not atomic as a group; if a move fails, files which were already
+    moved stay in place and the remaining temporary files are removed.
+
+        with SafeWriteTransaction() as txn:
+            for i in range(100):
+                with txn.open("shard{}.conf".format(i)) as f:
+                    f.write("shard = {}\n".format(i))
+    """
+
+    def __init__(self):
+        self.handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def open(self, file, **kwargs):
+        """Open a safe_write() filehandle as part of the transaction"""
+        fh = safe_write(file, **kwargs)
+        setattr(fh, "close", fh._sw_finish)
+        self.handles.append(fh)
+        return fh
+
+    def commit(self):
+        """Move all files into place"""
+        try:
+            for fh in self.handles:
+                fh._sw_finish()
+        except BaseException:
+            self.rollback()
+            raise
+        directories = set()
+        while self.handles:
+            fh = self.handles[0]
+            try:
+                fh._sw_rename()
+            except BaseException:
+                self.rollback()
+                raise
+            self.handles.pop(0)
+            if fh.committed:
+                directories.add(os.path.dirname(os.path.abspath(fh.dest_name)))
+        for directory in directories:
+            _fsync_dir(directory)
+
+    def rollback(self):
+        """Remove all temporary files"""
+        while self.handles:
+            fh = self.handles.pop()
+            try:
+                fh._sw_abort()
+            except Exception:
+                pass
+
+
 # SPDX-SnippetEnd
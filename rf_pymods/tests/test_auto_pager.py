@@ -4,6 +4,10 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import errno
+import os
+import threading
 import unittest
 import unittest.mock as mock
 
@@ -13,6 +17,7 @@ from rf_pymods.auto_pager import AutoPager
 
 @mock.patch("rf_pymods.auto_pager.subprocess.Popen")
 @mock.patch("rf_pymods.auto_pager.sys.stdout.isatty", return_value=False)
+@mock.patch("rf_pymods.auto_pager.os.get_terminal_size", side_effect=OSError)
 @mock.patch.dict("rf_pymods.auto_pager.os.environ", {"PAGER": "", "LESS": ""})
 @mock.patch("rf_pymods.auto_pager.sys.stdout")
 class TestAutoPager(unittest.TestCase):
@@ -26,6 +31,16 @@ class TestAutoPager(unittest.TestCase):
         mocks["Popen"].assert_called_once()
         self.assertEqual(mocks["Popen"].call_args[0], (["pager"],))
         self.assertEqual(pager.pager, mocks["Popen"]())
+        # Output is batched into a single write
+        pager.pager.stdin.write.assert_called_once_with("".join("{}\n".format(i) for i in range(1000)))
+
+    @decorated_mocks
+    def test_pager_unbuffered(self, mocks):
+        """Test TTY, buffer_size=0"""
+        mocks["isatty"].return_value = True
+        with AutoPager(buffer_size=0) as pager:
+            for i in range(1000):
+                print(i, file=pager)
         # print() gives the \n to write() separately, so 2x number
         # of print()s
         self.assertEqual(pager.pager.stdin.write.call_count, 2000)
@@ -47,9 +62,7 @@ class TestAutoPager(unittest.TestCase):
             print("foo", file=pager)
         mocks["Popen"].assert_not_called()
         self.assertEqual(pager.pager, None)
-        # print() gives the \n to write() separately, so 2x number
-        # of print()s
-        self.assertEqual(mocks["stdout"].write.call_count, 2)
+        mocks["stdout"].write.assert_called_once_with("foo\n")
 
     @mock.patch.dict("rf_pymods.auto_pager.os.environ", {"PAGER": "notfound"})
     @decorated_mocks
@@ -83,6 +96,7 @@ class TestAutoPager(unittest.TestCase):
         mocks["stdout"].write.side_effect = KeyboardInterrupt
         with AutoPager() as pager:
             print("foo", file=pager)
+            pager.flush()
             self.assertEqual(pager.closed, True)
             mocks["stdout"].write.assert_called_once()
 
@@ -92,9 +106,99 @@ class TestAutoPager(unittest.TestCase):
         mocks["stdout"].write.side_effect = BrokenPipeError
         with AutoPager() as pager:
             print("foo", file=pager)
+            pager.flush()
             self.assertEqual(pager.closed, True)
             mocks["stdout"].write.assert_called_once()
 
+    @decorated_mocks
+    def test_write_brokenpipeerror_unbuffered(self, mocks):
+        """Test BrokenPipeError during unbuffered write() closes pager"""
+        mocks["stdout"].write.side_effect = BrokenPipeError
+        with AutoPager(buffer_size=0) as pager:
+            print("foo", file=pager)
+            self.assertEqual(pager.closed, True)
+            print("bar", file=pager)
+            mocks["stdout"].write.assert_called_once_with("foo")
+
+    @decorated_mocks
+    def test_write_brokenpipeerror_close(self, mocks):
+        """Test BrokenPipeError writing the buffer at close() is ignored"""
+        mocks["isatty"].return_value = True
+        with AutoPager() as pager:
+            pager.pager.stdin.write.side_effect = BrokenPipeError
+            print("foo", file=pager)
+        self.assertEqual(pager.closed, True)
+        pager.pager.stdin.write.assert_called_once_with("foo\n")
+        pager.pager.stdin.close.assert_called_once()
+        pager.pager.wait.assert_called_once()
+
+    @decorated_mocks
+    def test_buffer_size(self, mocks):
+        """Test writes are batched up to buffer_size"""
+        with AutoPager(buffer_size=10) as pager:
+            for i in range(6):
+                pager.write("abcd")
+            self.assertEqual(mocks["stdout"].write.call_args_list, [mock.call("abcdabcdabcd")] * 2)
+        self.assertEqual(mocks["stdout"].write.call_count, 2)
+
+    @decorated_mocks
+    def test_del(self, mocks):
+        """Test buffered text is written when an unclosed pager is collected"""
+        pager = AutoPager()
+        pager.write("foo")
+        mocks["stdout"].write.assert_not_called()
+        del pager
+        mocks["stdout"].write.assert_called_once_with("foo")
+
+    @decorated_mocks
+    def test_writelines(self, mocks):
+        """Test writelines() batches lines"""
+        with AutoPager(buffer_size=10) as pager:
+            pager.writelines(["abcd"] * 7)
+            self.assertEqual(mocks["stdout"].write.call_count, 2)
+        self.assertEqual(mocks["stdout"].write.call_args_list[-1], mock.call("abcd"))
+
+    @decorated_mocks
+    def test_writelines_closed(self, mocks):
+        """Test writelines() stops after the pager is closed"""
+        mocks["stdout"].write.side_effect = BrokenPipeError
+        lines = iter(["abcd"] * 7)
+        with AutoPager(buffer_size=10) as pager:
+            pager.writelines(lines)
+            self.assertEqual(pager.closed, True)
+            pager.writelines(["abcd"])
+        mocks["stdout"].write.assert_called_once_with("abcdabcdabcd")
+        self.assertEqual(len(list(lines)), 4)
+
+    @decorated_mocks
+    def test_flush(self, mocks):
+        """Test flush() writes the buffer and flushes the underlying handle"""
+        with AutoPager() as pager:
+            pager.write("foo")
+            pager.flush()
+            mocks["stdout"].write.assert_called_once_with("foo")
+            mocks["stdout"].flush.assert_called_once()
+            pager.flush()
+            mocks["stdout"].write.assert_called_once()
+        pager.flush()
+        self.assertEqual(mocks["stdout"].flush.call_count, 2)
+
+    @decorated_mocks
+    def test_flush_keyboardinterrupt(self, mocks):
+        """Test KeyboardInterrupt during flush() closes pager"""
+        mocks["stdout"].flush.side_effect = KeyboardInterrupt
+        with AutoPager() as pager:
+            pager.flush()
+            self.assertEqual(pager.closed, True)
+
+    @decorated_mocks
+    def test_flush_brokenpipeerror(self, mocks):
+        """Test BrokenPipeError during flush() closes pager"""
+        mocks["stdout"].flush.side_effect = BrokenPipeError
+        with AutoPager() as pager:
+            pager.flush()
+            self.assertEqual(pager.closed, True)
+
     @decorated_mocks
     def test_close_keyboardinterrupt(self, mocks):
         """Test KeyboardInterrupt during close() is ignored"""
@@ -114,3 +218,465 @@ class TestAutoPager(unittest.TestCase):
             print("foo", file=pager)
         self.assertEqual(pager.closed, True)
         pager.pager.stdin.close.assert_called_once()
+
+
+@mock.patch("rf_pymods.auto_pager.subprocess.Popen")
+@mock.patch("rf_pymods.auto_pager.sys.stdout.isatty", return_value=True)
+@mock.patch("rf_pymods.auto_pager.os.get_terminal_size", return_value=os.terminal_size((80, 24)))
+@mock.patch.dict("rf_pymods.auto_pager.os.environ", {"PAGER": "", "LESS": ""})
+@mock.patch("rf_pymods.auto_pager.sys.stdout")
+class TestAutoPagerDeferred(unittest.TestCase):
+    @decorated_mocks
+    def test_short(self, mocks):
+        """Test output fitting on one screen is written without a pager"""
+        with AutoPager() as pager:
+            for i in range(23):
+                print(i, file=pager)
+            mocks["Popen"].assert_not_called()
+            mocks["stdout"].write.assert_not_called()
+        mocks["Popen"].assert_not_called()
+        mocks["stdout"].write.assert_called_once_with("".join("{}\n".format(i) for i in range(23)))
+
+    @decorated_mocks
+    def test_long(self, mocks):
+        """Test the pager is started once output exceeds one screen"""
+        with AutoPager(buffer_size=0) as pager:
+            for i in range(23):
+                print(i, file=pager)
+            mocks["Popen"].assert_not_called()
+            print(23, file=pager)
+            mocks["Popen"].assert_called_once()
+            self.assertEqual(mocks["Popen"].call_args[0], (["pager"],))
+            self.assertEqual(mocks["Popen"].call_args[1]["env"]["LESS"], "FRX")
+            print(24, file=pager)
+        mocks["stdout"].write.assert_not_called()
+        written = "".join(c[0][0] for c in pager.pager.stdin.write.call_args_list)
+        self.assertEqual(written, "".join("{}\n".format(i) for i in range(25)))
+
+    @decorated_mocks
+    def test_long_buffered(self, mocks):
+        """Test the pager is started when a full buffer exceeds one screen"""
+        with AutoPager(buffer_size=100) as pager:
+            for i in range(100):
+                print(i, file=pager)
+            mocks["Popen"].assert_called_once()
+        written = "".join(c[0][0] for c in pager.pager.stdin.write.call_args_list)
+        self.assertEqual(written, "".join("{}\n".format(i) for i in range(100)))
+
+    @mock.patch.dict("rf_pymods.auto_pager.os.environ", {"PAGER": "altpager"})
+    @decorated_mocks
+    def test_pager_cmd_env(self, mocks):
+        """Test PAGER=altpager with a deferred pager"""
+        with AutoPager(buffer_size=0) as pager:
+            pager.write("foo\n" * 30)
+        mocks["Popen"].assert_called_once()
+        self.assertEqual(mocks["Popen"].call_args[0], (["altpager"],))
+
+    @decorated_mocks
+    def test_wrapped(self, mocks):
+        """Test wrapped lines count as multiple rows"""
+        with AutoPager(buffer_size=0) as pager:
+            for i in range(11):
+                pager.write("x" * 160 + "\n")
+            mocks["Popen"].assert_not_called()
+            pager.write("x" * 81)
+            mocks["Popen"].assert_called_once()
+
+    @decorated_mocks
+    def test_exact_width(self, mocks):
+        """Test lines of exactly the terminal width count as one row"""
+        with AutoPager(buffer_size=0) as pager:
+            pager.writelines(["x" * 80 + "\n"] * 23)
+        mocks["Popen"].assert_not_called()
+
+    @decorated_mocks
+    def test_partial_line(self, mocks):
+        """Test a trailing partial line counts as a row"""
+        with AutoPager(buffer_size=0) as pager:
+            pager.write("x\n" * 23)
+            pager.write("x")
+            mocks["Popen"].assert_called_once()
+
+    @decorated_mocks
+    def test_flush(self, mocks):
+        """Test flush() writes output which fits on one screen without a pager"""
+        with AutoPager() as pager:
+            pager.write("foo\n")
+            pager.flush()
+            mocks["stdout"].write.assert_called_once_with("foo\n")
+            mocks["stdout"].flush.assert_called_once()
+            pager.write("bar\n")
+            mocks["stdout"].write.assert_called_once()
+        mocks["Popen"].assert_not_called()
+        self.assertEqual(mocks["stdout"].write.call_args_list, [mock.call("foo\n"), mock.call("bar\n")])
+
+    @decorated_mocks
+    def test_flush_long(self, mocks):
+        """Test output flushed without a pager counts towards one screen"""
+        with AutoPager() as pager:
+            pager.write("foo\n" * 20)
+            pager.flush()
+            pager.write("bar\n" * 3)
+            pager.flush()
+            mocks["Popen"].assert_not_called()
+            pager.write("baz\n")
+            pager.flush()
+            mocks["Popen"].assert_called_once()
+        self.assertEqual(mocks["stdout"].write.call_args_list, [mock.call("foo\n" * 20), mock.call("bar\n" * 3)])
+        pager.pager.stdin.write.assert_called_once_with("baz\n")
+
+    @decorated_mocks
+    def test_notfound(self, mocks):
+        """Test Popen() returning FileNotFoundError when the pager is started"""
+        mocks["Popen"].side_effect = FileNotFoundError
+        with AutoPager(buffer_size=0) as pager:
+            pager.write("foo\n" * 30)
+        self.assertEqual(pager.pager, None)
+        mocks["stdout"].write.assert_called_once_with("foo\n" * 30)
+
+    @decorated_mocks
+    def test_terminal_size_unknown(self, mocks):
+        """Test the pager is started immediately without a terminal size"""
+        mocks["get_terminal_size"].return_value = os.terminal_size((0, 0))
+        AutoPager().close()
+        mocks["Popen"].assert_called_once()
+
+    @decorated_mocks
+    def test_terminal_size_oserror(self, mocks):
+        """Test the pager is started immediately if get_terminal_size() fails"""
+        mocks["get_terminal_size"].side_effect = OSError
+        AutoPager().close()
+        mocks["Popen"].assert_called_once()
+
+
+@mock.patch("rf_pymods.auto_pager.subprocess.Popen")
+@mock.patch("rf_pymods.auto_pager.sys.stdout.isatty", return_value=False)
+@mock.patch.dict("rf_pymods.auto_pager.os.environ", {"PAGER": "", "LESS": ""})
+@mock.patch("rf_pymods.auto_pager.sys.stdout")
+class TestAutoPagerBackground(unittest.TestCase):
+    def blocking_write(self, mocks):
+        """Make stdout.write() block until released"""
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.written = []
+
+        def _write(data):
+            self.started.set()
+            self.assertTrue(self.release.wait(10))
+            self.written.append(data)
+
+        mocks["stdout"].write.side_effect = _write
+
+    @decorated_mocks
+    def test_background(self, mocks):
+        """Test writes are passed to a writer thread"""
+        with AutoPager(background=True) as pager:
+            for i in range(1000):
+                print(i, file=pager)
+            self.assertEqual(pager._thread.name, "auto-pager-writer")
+        self.assertFalse(pager._thread.is_alive())
+        written = "".join(c[0][0] for c in mocks["stdout"].write.call_args_list)
+        self.assertEqual(written, "".join("{}\n".format(i) for i in range(1000)))
+
+    @decorated_mocks
+    def test_full_block(self, mocks):
+        """Test full="block" blocks the producer until the queue has room"""
+        self.blocking_write(mocks)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1)
+        pager.write("1")
+        self.assertTrue(self.started.wait(10))
+        pager.write("2")
+        producer = threading.Thread(target=pager.write, args=("3",))
+        producer.start()
+        producer.join(0.1)
+        self.assertTrue(producer.is_alive())
+        self.release.set()
+        producer.join(10)
+        pager.close()
+        self.assertEqual(self.written, ["1", "2", "3"])
+
+    @decorated_mocks
+    def test_full_drop(self, mocks):
+        """Test full="drop" discards batches while the queue is full"""
+        self.blocking_write(mocks)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1, full="drop")
+        pager.write("1")
+        self.assertTrue(self.started.wait(10))
+        pager.write("2")
+        pager.write("33")
+        pager.write("444")
+        self.assertEqual(pager.dropped, 5)
+        self.release.set()
+        pager.close()
+        self.assertEqual(self.written, ["1", "2"])
+
+    @decorated_mocks
+    def test_full_spill(self, mocks):
+        """Test full="spill" writes spilled batches in order"""
+        self.blocking_write(mocks)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1, full="spill")
+        pager.write("1")
+        self.assertTrue(self.started.wait(10))
+        pager.write("2")
+        pager.write("3")
+        pager.write("4")
+        spill = pager._spill
+        self.assertIsNotNone(spill)
+        self.release.set()
+        pager.flush()
+        self.assertEqual(self.written, ["1", "2", "34"])
+        self.assertTrue(spill.closed)
+        self.assertIsNone(pager._spill)
+        pager.write("5")
+        pager.close()
+        self.assertEqual(self.written, ["1", "2", "34", "5"])
+        self.assertEqual(pager.dropped, 0)
+
+    @decorated_mocks
+    def test_full_spill_chunks(self, mocks):
+        """Test spilled batches are read back in bounded chunks"""
+        self.blocking_write(mocks)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1, full="spill")
+        pager.write("1")
+        self.assertTrue(self.started.wait(10))
+        pager.write("2")
+        pager.write("a" * 100000)
+        pager.write("b")
+        spill = pager._spill
+        self.release.set()
+        pager.close()
+        self.assertEqual(self.written, ["1", "2", "a" * 65536, "a" * 34464 + "b"])
+        self.assertTrue(spill.closed)
+
+    @decorated_mocks
+    def test_full_spill_close(self, mocks):
+        """Test spilled batches are written on close()"""
+        self.blocking_write(mocks)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1, full="spill")
+        pager.write("1")
+        self.assertTrue(self.started.wait(10))
+        pager.write("2")
+        pager.write("3")
+        closer = threading.Thread(target=pager.close)
+        closer.start()
+        self.release.set()
+        closer.join(10)
+        self.assertEqual(self.written, ["1", "2", "3"])
+
+    @decorated_mocks
+    def test_full_invalid(self, mocks):
+        """Test an unknown full policy"""
+        with self.assertRaises(ValueError):
+            AutoPager(full="explode")
+
+    @decorated_mocks
+    def test_brokenpipeerror(self, mocks):
+        """Test BrokenPipeError in the writer thread closes pager on the next write"""
+        mocks["stdout"].write.side_effect = BrokenPipeError
+        with AutoPager(buffer_size=0, background=True) as pager:
+            pager.write("1")
+            pager._queue.join()
+            self.assertEqual(pager.closed, False)
+            pager.write("2")
+            self.assertEqual(pager.closed, True)
+        mocks["stdout"].write.assert_called_once_with("1")
+        self.assertFalse(pager._thread.is_alive())
+
+    @decorated_mocks
+    def test_brokenpipeerror_flush(self, mocks):
+        """Test BrokenPipeError in the writer thread closes pager on flush()"""
+        mocks["stdout"].write.side_effect = BrokenPipeError
+        pager = AutoPager(buffer_size=0, background=True)
+        pager.write("1")
+        pager.flush()
+        self.assertEqual(pager.closed, True)
+        mocks["stdout"].flush.assert_not_called()
+
+    @decorated_mocks
+    def test_brokenpipeerror_discard(self, mocks):
+        """Test batches queued after a BrokenPipeError are discarded"""
+        mocks["stdout"].write.side_effect = BrokenPipeError
+        pager = AutoPager(buffer_size=0, background=True)
+        pager._queue.put("1")
+        pager._queue.put("2")
+        pager._queue.join()
+        pager.close()
+        mocks["stdout"].write.assert_called_once_with("1")
+
+    @decorated_mocks
+    def test_error_write(self, mocks):
+        """Test other errors in the writer thread are raised from the next write"""
+        mocks["stdout"].write.side_effect = OSError(errno.EIO, "Input/output error")
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1)
+        pager.write("1")
+        pager._queue.join()
+        with self.assertRaises(OSError) as cm:
+            pager.write("2")
+        self.assertEqual(cm.exception.errno, errno.EIO)
+        self.assertEqual(pager.closed, True)
+        self.assertFalse(pager._thread.is_alive())
+        pager.write("3")
+        pager.close()
+        mocks["stdout"].write.assert_called_once_with("1")
+
+    @decorated_mocks
+    def test_error_flush(self, mocks):
+        """Test other errors in the writer thread are raised from flush()"""
+        mocks["stdout"].write.side_effect = UnicodeEncodeError("ascii", "\u2603", 0, 1, "ordinal not in range")
+        pager = AutoPager(background=True)
+        pager.write("\u2603")
+        with self.assertRaises(UnicodeEncodeError):
+            pager.flush()
+        self.assertEqual(pager.closed, True)
+        mocks["stdout"].flush.assert_not_called()
+
+    @decorated_mocks
+    def test_error_close(self, mocks):
+        """Test other errors in the writer thread do not block producers, and are raised from close()"""
+        mocks["stdout"].write.side_effect = OSError(errno.EIO, "Input/output error")
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1)
+        for i in range(10):
+            pager._put(str(i))
+        with self.assertRaises(OSError):
+            pager.close()
+        self.assertEqual(pager.closed, True)
+        self.assertFalse(pager._thread.is_alive())
+        mocks["stdout"].write.assert_called_once_with("0")
+
+    @decorated_mocks
+    def test_error_spill(self, mocks):
+        """Test errors reading back spilled batches are raised from close()"""
+        self.blocking_write(mocks)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1, full="spill")
+        pager.write("1")
+        self.assertTrue(self.started.wait(10))
+        pager.write("2")
+        pager.write("3")
+        pager._spill.read = mock.Mock(side_effect=OSError(errno.EIO, "Input/output error"))
+        self.release.set()
+        with self.assertRaises(OSError):
+            pager.close()
+        self.assertEqual(self.written, ["1", "2"])
+
+    @decorated_mocks
+    def test_keyboardinterrupt(self, mocks):
+        """Test KeyboardInterrupt while waiting for the queue closes pager"""
+        pager = AutoPager(buffer_size=0, background=True)
+        put = pager._queue.put
+
+        def _put(data):
+            if data is not None:
+                raise KeyboardInterrupt
+            put(data)
+
+        with mock.patch.object(pager._queue, "put", side_effect=_put):
+            pager.write("1")
+        self.assertEqual(pager.closed, True)
+        self.assertFalse(pager._thread.is_alive())
+        mocks["stdout"].write.assert_not_called()
+
+    @decorated_mocks
+    def test_flush(self, mocks):
+        """Test flush() waits for the writer thread"""
+        self.blocking_write(mocks)
+        with AutoPager(background=True) as pager:
+            pager.write("foo")
+            flusher = threading.Thread(target=pager.flush)
+            flusher.start()
+            self.assertTrue(self.started.wait(10))
+            mocks["stdout"].flush.assert_not_called()
+            self.release.set()
+            flusher.join(10)
+            self.assertEqual(self.written, ["foo"])
+            mocks["stdout"].flush.assert_called_once()
+
+
+class TestAutoPagerAwrite(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # decorated_mocks does not support coroutines, so patch here
+        self.stdout = mock.patch("rf_pymods.auto_pager.sys.stdout").start()
+        self.stdout.isatty.return_value = False
+        self.addCleanup(mock.patch.stopall)
+
+    async def test_awrite(self):
+        """Test awrite() without a writer thread writes batches in an executor"""
+        with AutoPager(buffer_size=0) as pager:
+            await pager.awrite("foo")
+        self.stdout.write.assert_called_once_with("foo")
+
+    async def test_awrite_buffered(self):
+        """Test awrite() buffers text without an executor"""
+        with AutoPager() as pager:
+            with mock.patch("rf_pymods.auto_pager.asyncio.get_running_loop") as mock_loop:
+                await pager.awrite("foo")
+                await pager.awrite("bar")
+            mock_loop.assert_not_called()
+            self.stdout.write.assert_not_called()
+        self.stdout.write.assert_called_once_with("foobar")
+
+    async def test_awrite_closed(self):
+        """Test awrite() after close()"""
+        pager = AutoPager(buffer_size=0)
+        pager.close()
+        await pager.awrite("foo")
+        self.stdout.write.assert_not_called()
+
+    async def test_awrite_concurrent(self):
+        """Test concurrent awrite() calls write one batch at a time, in order"""
+        writing = []
+        written = []
+
+        def _write(data):
+            writing.append(data)
+            self.assertEqual(len(writing), 1)
+            threading.Event().wait(0.05)
+            written.append(writing.pop())
+
+        self.stdout.write.side_effect = _write
+        pager = AutoPager(buffer_size=0)
+        await asyncio.gather(*(pager.awrite(str(i)) for i in range(3)))
+        pager.close()
+        self.assertEqual(written, ["0", "12"])
+
+    async def test_awrite_brokenpipeerror(self):
+        """Test BrokenPipeError while writing in an executor closes pager"""
+        self.stdout.write.side_effect = BrokenPipeError
+        pager = AutoPager(buffer_size=0)
+        # In its own task, as coverage loses track of the caller after
+        # an exception is thrown into a coroutine
+        await asyncio.ensure_future(pager.awrite("foo"))
+        self.assertEqual(pager.closed, True)
+        await pager.awrite("bar")
+        self.stdout.write.assert_called_once_with("foo")
+
+    async def test_awrite_background_broken(self):
+        """Test awrite() with a full queue after BrokenPipeError closes pager"""
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1)
+        pager._broken = True
+        with mock.patch.object(pager._queue, "full", return_value=True):
+            await pager.awrite("foo")
+        self.assertEqual(pager.closed, True)
+        self.stdout.write.assert_not_called()
+
+    async def test_awrite_background(self):
+        """Test awrite() with a writer thread and room in the queue"""
+        with AutoPager(buffer_size=0, background=True) as pager:
+            with mock.patch("rf_pymods.auto_pager.asyncio.get_running_loop") as mock_loop:
+                await pager.awrite("foo")
+            mock_loop.assert_not_called()
+        self.stdout.write.assert_called_once_with("foo")
+
+    async def test_awrite_background_full(self):
+        """Test awrite() with a full queue waits in an executor"""
+        release = threading.Event()
+        self.stdout.write.side_effect = lambda data: release.wait(10)
+        pager = AutoPager(buffer_size=0, background=True, queue_size=1)
+        pager.write("1")
+        pager.write("2")
+        task = asyncio.ensure_future(pager.awrite("3"))
+        await asyncio.sleep(0.1)
+        self.assertFalse(task.done())
+        release.set()
+        await task
+        pager.close()
+        self.assertEqual(self.stdout.write.call_args_list[-1], mock.call("3"))
@@ -4,9 +4,21 @@
 # SPDX-FileCopyrightText: © 2021 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import array
+import functools
+import json
+import math
+import pickle
+import random
 from unittest import TestCase
+import unittest.mock as mock
 
-from rf_pymods.ewma import EWMA
+from rf_pymods.ewma import EWMA, EWMABank, EWMVariance, Quantile, RollingWindow, TimeEWMA
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
 
 class TestEWMA(TestCase):
@@ -47,3 +59,372 @@ class TestEWMA(TestCase):
 
     def test_sum(self):
         self.assertEqual(EWMA([1, 2, 3]).sum, 6)
+
+
+class TestEWMAMerge(TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        self.vals = [rand.random() * 100 for _ in range(10000)]
+
+    def test_merge(self):
+        a = EWMA(self.vals[:3000])
+        self.assertIs(a.merge(EWMA(self.vals[3000:])), a)
+        expected = EWMA(self.vals)
+        self.assertTrue(math.isclose(a.average, expected.average, rel_tol=1e-9))
+        self.assertTrue(math.isclose(a.sum, expected.sum, rel_tol=1e-9))
+        self.assertEqual(a.items, expected.items)
+
+    def test_reduce(self):
+        partials = [EWMA(self.vals[i : i + 777], weight=20.0) for i in range(0, len(self.vals), 777)]
+        a = functools.reduce(EWMA.merge, partials)
+        self.assertTrue(math.isclose(a.average, EWMA(self.vals, weight=20.0).average, rel_tol=1e-9))
+
+    def test_merge_empty(self):
+        a = EWMA([1, 2, 3])
+        a.merge(EWMA())
+        self.assertEqual(a.average, 1.359375)
+        b = EWMA()
+        b.merge(EWMA([1, 2, 3]))
+        self.assertEqual(b.average, 1.359375)
+
+    def test_merge_state(self):
+        a = EWMA([1])
+        a.merge(json.loads(json.dumps(EWMA([2, 3]).state())))
+        self.assertTrue(math.isclose(a.average, 1.359375, rel_tol=1e-9))
+        self.assertEqual(a.items, 3)
+        self.assertEqual(a.sum, 6)
+
+    def test_state(self):
+        a = EWMA([1, 2, 3], weight=20.0)
+        self.assertEqual(a.state(), (20.0, 3, 6, 1.1475))
+        b = EWMA.from_state(pickle.loads(pickle.dumps(a.state())))
+        self.assertEqual(b.state(), a.state())
+
+    def test_merge_weight(self):
+        with self.assertRaises(ValueError):
+            EWMA([1]).merge(EWMA([2], weight=4.0))
+
+
+class TestEWMVariance(TestCase):
+    def test_average(self):
+        a = EWMVariance([1, 2, 3])
+        self.assertEqual(a.average, 1.359375)
+        self.assertEqual(a.items, 3)
+        self.assertEqual(a.sum, 6)
+
+    def test_variance(self):
+        a = EWMVariance(weight=2.0)
+        a.add(3)
+        self.assertEqual(a.average, 2.0)
+        self.assertEqual(a.variance, 1.0)
+        self.assertEqual(a.stddev, 1.0)
+
+    def test_constant(self):
+        a = EWMVariance([5.0] * 1000)
+        self.assertAlmostEqual(a.average, 5.0)
+        self.assertAlmostEqual(a.variance, 0.0)
+
+    def test_stddev(self):
+        rand = random.Random(0)
+        a = EWMVariance([rand.gauss(50, 10) for _ in range(20000)], weight=1000.0)
+        self.assertAlmostEqual(a.average, 50, delta=2)
+        self.assertAlmostEqual(a.stddev, 10, delta=1)
+
+    def test_quantiles(self):
+        rand = random.Random(0)
+        vals = [rand.random() for _ in range(1000)]
+        a = EWMVariance(vals, quantiles=(0.5, 0.99))
+        self.assertEqual(a.quantiles[0.5].value, Quantile(0.5, vals).value)
+        self.assertEqual(a.quantiles[0.99].value, Quantile(0.99, vals).value)
+        self.assertEqual(len(a.quantiles[0.99]), 1000)
+
+    def test_complex(self):
+        a = EWMVariance(1 + 2j, weight=2.0)
+        self.assertEqual(a.average, 1 + 1j)
+        self.assertEqual(a.variance, 1.0)
+        self.assertEqual(a.stddev, 1.0)
+        self.assertEqual(a.items, 1)
+        self.assertEqual(EWMVariance([1 + 2j]).average, EWMA(1 + 2j).average)
+
+    def test_complex_quantiles(self):
+        a = EWMVariance([1, 2], quantiles=(0.5,))
+        with self.assertRaises(TypeError):
+            a.add([3, 1 + 2j])
+        self.assertEqual(a.average, EWMA([1, 2, 3]).average)
+        self.assertEqual(a.items, 3)
+        self.assertEqual(len(a.quantiles[0.5]), 3)
+        with self.assertRaises(TypeError):
+            EWMVariance(1 + 2j, quantiles=(0.5,))
+
+    def test_interface(self):
+        a = EWMVariance([1.5])
+        a.append(2.5)
+        a.extend([3.5])
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.sum, 7.5)
+        self.assertEqual(float(a), EWMA([1.5, 2.5, 3.5]).average)
+        self.assertEqual(int(a), 1)
+        self.assertFalse(hasattr(a, "merge"))
+        self.assertFalse(hasattr(a, "state"))
+
+
+class TestQuantile(TestCase):
+    def test_exact(self):
+        self.assertEqual(Quantile(0.5, [3, 1, 2]).value, 2)
+        self.assertEqual(Quantile(0.5, [1, 2, 3, 4]).value, 2.5)
+        self.assertEqual(Quantile(0.5, 7).value, 7)
+
+    def test_empty(self):
+        self.assertEqual(Quantile(0.5).value, 0.0)
+
+    def test_estimate(self):
+        rand = random.Random(0)
+        vals = [rand.random() * 100 for _ in range(20000)]
+        for q in (0.01, 0.5, 0.9, 0.99):
+            self.assertAlmostEqual(Quantile(q, vals).value, sorted(vals)[int(q * len(vals))], delta=1)
+
+    def test_sorted(self):
+        a = Quantile(0.5, range(1001))
+        self.assertAlmostEqual(a.value, 500, delta=1)
+        a = Quantile(0.9, range(1000, -1, -1))
+        self.assertAlmostEqual(a.value, 900, delta=1)
+
+    def test_interface(self):
+        a = Quantile(0.5, [1.5])
+        a.append(2.5)
+        a.extend([3.5])
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.sum, 7.5)
+        self.assertEqual(float(a), 2.5)
+        self.assertEqual(int(a), 2)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Quantile(1)
+
+
+class TestEWMABulk(TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        self.vals = [rand.random() * 100 for _ in range(10000)]
+        self.expected = EWMA([5.0] + self.vals)
+
+    def assertBulk(self, a):
+        self.assertTrue(math.isclose(a.average, self.expected.average, rel_tol=1e-9))
+        self.assertTrue(math.isclose(a.sum, self.expected.sum, rel_tol=1e-9))
+        self.assertEqual(a.items, self.expected.items)
+
+    def test_array(self):
+        a = EWMA(5.0)
+        a.add(array.array("d", self.vals))
+        self.assertBulk(a)
+
+    def test_memoryview(self):
+        a = EWMA(5.0)
+        a.add(memoryview(array.array("d", self.vals)))
+        self.assertBulk(a)
+
+    def test_array_int(self):
+        a = EWMA(array.array("i", [1, 2, 3]))
+        self.assertTrue(math.isclose(a.average, 1.359375, rel_tol=1e-9))
+        self.assertEqual(a.sum, 6)
+        self.assertEqual(a.items, 3)
+
+    def test_array_int_overflow(self):
+        a = EWMA(array.array("q", [2**62, 2**62]))
+        self.assertEqual(a.sum, 2**63)
+        self.assertEqual(a.sum, EWMA([2**62, 2**62]).sum)
+
+    def test_array_weight(self):
+        a = EWMA(array.array("i", [1, 2, 3]), weight=20.0)
+        self.assertTrue(math.isclose(a.average, 1.1475, rel_tol=1e-9))
+
+    def test_array_empty(self):
+        a = EWMA(array.array("d"))
+        self.assertEqual(a.average, 1.0)
+        self.assertEqual(a.items, 0)
+
+    def test_array_python(self):
+        with mock.patch("rf_pymods.ewma.numpy", None):
+            a = EWMA(5.0)
+            with mock.patch.object(a, "_add_bulk") as mock_add_bulk:
+                a.add(array.array("d", self.vals))
+            mock_add_bulk.assert_not_called()
+        self.assertBulk(a)
+
+    def test_array_empty_python(self):
+        with mock.patch("rf_pymods.ewma.numpy", None):
+            a = EWMA(array.array("d"))
+        self.assertEqual(a.average, 1.0)
+        self.assertEqual(a.items, 0)
+
+    def test_chunks(self):
+        a = EWMA(5.0)
+        a.bulk_chunk_size = 999
+        a.add(array.array("d", self.vals))
+        self.assertBulk(a)
+
+    def test_numpy(self):
+        if numpy is None:  # pragma: no cover
+            self.skipTest("numpy not available")
+        a = EWMA(5.0)
+        a.add(numpy.array(self.vals))
+        self.assertBulk(a)
+        self.assertIsInstance(a.average, float)
+        self.assertIsInstance(a.sum, float)
+
+
+class TestRollingWindow(TestCase):
+    def test_partial(self):
+        a = RollingWindow(5, [1, 2, 3])
+        self.assertEqual(a.average, 2.0)
+        self.assertEqual(a.sum, 6)
+        self.assertEqual(len(a), 3)
+
+    def test_window(self):
+        a = RollingWindow(3, [1, 2, 3, 4, 5])
+        self.assertEqual(a.average, 4.0)
+        self.assertEqual(a.sum, 12)
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.items, 5)
+
+    def test_matches_sum(self):
+        rand = random.Random(0)
+        vals = [rand.random() * 100 for _ in range(1000)]
+        a = RollingWindow(7)
+        for i, number in enumerate(vals):
+            a.append(number)
+            window = vals[max(i - 6, 0) : i + 1]
+            self.assertAlmostEqual(a.average, sum(window) / len(window))
+
+    def test_empty(self):
+        a = RollingWindow(3)
+        self.assertEqual(a.average, 0.0)
+        self.assertEqual(len(a), 0)
+
+    def test_interface(self):
+        a = RollingWindow(2, 1.5)
+        a.append(2.5)
+        a.extend([3.5])
+        self.assertEqual(float(a), 3.0)
+        self.assertEqual(int(a), 3)
+
+    def test_size_invalid(self):
+        with self.assertRaises(ValueError):
+            RollingWindow(0)
+
+
+class TestTimeEWMA(TestCase):
+    def test_first(self):
+        a = TimeEWMA(10.0)
+        a.add(5.0, 100.0)
+        self.assertEqual(a.average, 5.0)
+
+    def test_half_life(self):
+        a = TimeEWMA(10.0, [(0.0, 0.0), (10.0, 10.0)])
+        self.assertAlmostEqual(a.average, 10.0 / 1.5)
+
+    def test_same_timestamp(self):
+        a = TimeEWMA(10.0, [(1.0, 5.0), (2.0, 5.0), (3.0, 5.0)])
+        self.assertAlmostEqual(a.average, 2.0)
+
+    def test_gap(self):
+        a = TimeEWMA(1.0, [(0.0, 0.0), (100.0, 1e6)])
+        self.assertEqual(a.average, 100.0)
+
+    def test_out_of_order(self):
+        a = TimeEWMA(10.0, [(10.0, 10.0), (0.0, 0.0)])
+        self.assertAlmostEqual(a.average, 10.0 / 1.5)
+        self.assertEqual(a.timestamp, 10.0)
+
+    def test_matches_ewma(self):
+        # Evenly spaced samples decay like a fixed weight EWMA
+        weight = 8.0
+        half_life = math.log(2) / -math.log(1 - 1 / weight)
+        vals = [float(i % 7) for i in range(500)]
+        a = TimeEWMA(half_life, ((v, i) for i, v in enumerate(vals)))
+        self.assertAlmostEqual(a.average, EWMA(vals, weight=weight).average)
+
+    def test_default_timestamp(self):
+        a = TimeEWMA(10.0)
+        with mock.patch("rf_pymods.ewma.time.monotonic", return_value=50.0):
+            a.append(3.0)
+        self.assertEqual(a.timestamp, 50.0)
+
+    def test_len_sum(self):
+        a = TimeEWMA(10.0, [(1, 0), (2, 1), (3, 2)])
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a.sum, 6)
+
+    def test_float_int(self):
+        a = TimeEWMA(10.0, [(2.5, 0)])
+        self.assertEqual(float(a), 2.5)
+        self.assertEqual(int(a), 2)
+
+    def test_slots(self):
+        a = TimeEWMA(10.0)
+        self.assertFalse(hasattr(a, "__dict__"))
+
+    def test_half_life_invalid(self):
+        with self.assertRaises(ValueError):
+            TimeEWMA(0)
+
+
+class TestEWMABank(TestCase):
+    def test_add(self):
+        bank = EWMABank()
+        for value in (1, 2, 3):
+            bank.add("a", value)
+        self.assertEqual(bank["a"], 1.359375)
+        self.assertEqual(bank.count("a"), 3)
+        self.assertEqual(bank.sum("a"), 6)
+
+    def test_update(self):
+        bank = EWMABank(weight=20.0)
+        bank.update(["a", "b", "a", "a"], [1, 5, 2, 3])
+        self.assertEqual(bank["a"], EWMA([1, 2, 3], weight=20.0).average)
+        self.assertEqual(bank["b"], EWMA([5], weight=20.0).average)
+
+    def test_container(self):
+        bank = EWMABank()
+        bank.update(["a", "b"], [1, 2])
+        self.assertEqual(len(bank), 2)
+        self.assertIn("a", bank)
+        self.assertNotIn("c", bank)
+        self.assertEqual(sorted(bank), ["a", "b"])
+        with self.assertRaises(KeyError):
+            bank["c"]
+
+    def test_delete_reuse(self):
+        bank = EWMABank()
+        bank.update(["a", "b"], [10, 20])
+        del bank["a"]
+        self.assertNotIn("a", bank)
+        bank.add("c", 3)
+        self.assertEqual(len(bank._averages), 2)
+        self.assertEqual(bank["c"], EWMA([3]).average)
+        self.assertEqual(bank.count("c"), 1)
+        self.assertEqual(bank.sum("c"), 3)
+
+    def test_top(self):
+        bank = EWMABank(weight=1.0)
+        bank.update(["a", "b", "c", "d"], [3, 1, 4, 2])
+        self.assertEqual(bank.top(2), [("c", 4.0), ("a", 3.0)])
+        self.assertEqual(bank.top(2, largest=False), [("b", 1.0), ("d", 2.0)])
+
+    def test_threshold(self):
+        bank = EWMABank(weight=1.0)
+        bank.update(["a", "b", "c", "d"], [3, 1, 4, 2])
+        self.assertEqual(sorted(bank.above(2)), [("a", 3.0), ("c", 4.0)])
+        self.assertEqual(sorted(bank.below(2)), [("b", 1.0)])
+
+    def test_evict(self):
+        bank = EWMABank()
+        with mock.patch("rf_pymods.ewma.time.monotonic", return_value=100.0):
+            bank.update(["a", "b"], [1, 2])
+        with mock.patch("rf_pymods.ewma.time.monotonic", return_value=150.0):
+            bank.add("b", 3)
+            self.assertEqual(bank.evict(30), ["a"])
+        self.assertEqual(list(bank), ["b"])
+        self.assertEqual(bank.evict(30, now=200.0), ["b"])
+        self.assertEqual(len(bank), 0)
@@ -4,9 +4,18 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import array
+import fractions
+import math
+import random
 from unittest import TestCase
 
-from rf_pymods.numfmt import numfmt
+from rf_pymods.numfmt import NumberFormat, _compile, _formatter, numfmt, numfmt_many, numfmt_table, numparse, numparse_many
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
 
 
 class TestNumfmt(TestCase):
@@ -69,3 +78,203 @@ class TestNumfmt(TestCase):
 
     def test_negative(self):
         self.assertEqual("{}".format(numfmt(-12345)), "-12.35 k")
+
+    def test_type(self):
+        self.assertIsInstance(numfmt(12345), NumberFormat)
+        self.assertEqual(numfmt(12345), 12.345)
+
+    def test_zero(self):
+        self.assertEqual("{}".format(numfmt(0)), "0.00 ")
+
+    def test_limit_prefixes(self):
+        self.assertEqual("{}".format(numfmt(10**30)), "1000000.00 Y")
+
+    def test_custom_prefixes(self):
+        self.assertEqual("{}".format(numfmt(12345678, prefixes=[("x", "xi")])), "12345.68 x")
+
+    def test_rounding_above_threshold(self):
+        # Dividing by 1000 repeatedly rounds differently than a single
+        # comparison against the threshold
+        self.assertEqual("{}".format(numfmt(1.507e24, rollover=1.507)), "1507.00 Z")
+
+    def test_rounding_below_threshold(self):
+        self.assertEqual("{}".format(numfmt(1.2049999999999999e24, rollover=1.205)), "1.21 Y")
+
+    def test_many(self):
+        vals = [0, 999, 1000, -12345, 1032456, 123000000000, 10**30]
+        for kwargs in ({}, {"binary": True}, {"rollover": 1.1}, {"limit": 2}, {"fmt": "{num.real:0.04f}{num.prefix}B"}):
+            self.assertEqual(
+                [str(num) for num in numfmt_many(vals, **kwargs)],
+                [str(numfmt(val, **kwargs)) for val in vals],
+            )
+
+    def test_many_prefixes(self):
+        self.assertEqual([str(num) for num in numfmt_many([12345], prefixes=[["x", "xi"]])], ["12.35 x"])
+
+    def test_many_array(self):
+        self.assertEqual([str(num) for num in numfmt_many(array.array("d", [12345, 2048]), binary=True)], ["12.06 Ki", "2.00 Ki"])
+
+    def test_fmt_single_field(self):
+        self.assertEqual(str(numfmt(12345, fmt="{num.prefix!r}")), "'k'")
+
+    def test_fmt_literal_braces(self):
+        self.assertEqual(str(numfmt(12345, fmt="{{{num.real:0.01f}}} {num.prefix}")), "{12.3} k")
+
+    def test_fmt_fallback(self):
+        # Fields other than num.attribute are left to str.format()
+        self.assertEqual(str(numfmt(12345, fmt="{num.real:{num.prefix}<1}")), "12.345")
+        self.assertEqual(str(numfmt(12345, fmt="{num.prefix[0]}")), "k")
+        self.assertEqual(str(numfmt(12345, fmt="no fields")), "no fields")
+        with self.assertRaises(KeyError):
+            str(numfmt(12345, fmt="{other}"))
+        with self.assertRaises(ValueError):
+            str(numfmt(12345, fmt="{num.real"))
+
+    def test_fmt_changed(self):
+        num = numfmt(12345)
+        num.fmt = "{num.real:0.01f}{num.prefix}B"
+        self.assertEqual(str(num), "12.3kB")
+
+    def test_direct(self):
+        num = NumberFormat(1.5)
+        self.assertEqual(str(num), "1.50 ")
+
+    def test_cache(self):
+        _compile.cache_clear()
+        _formatter.cache_clear()
+        numfmt(12345)
+        numfmt(54321)
+        str(numfmt(12345, prefixes=[["x", "xi"]]))
+        str(numfmt(12345))
+        self.assertEqual(_formatter.cache_info().hits, 2)
+        self.assertEqual(_compile.cache_info().hits, 1)
+
+
+class TestNumparse(TestCase):
+    def test_decimal(self):
+        self.assertEqual(numparse("12.35 k"), 12350)
+        self.assertEqual(numparse("1.5M"), 1500000)
+
+    def test_binary(self):
+        self.assertEqual(numparse("12.06 KiB"), 12.06 * 1024)
+        self.assertEqual(numparse("12.06 KiB", binary=True), 12.06 * 1024)
+
+    def test_binary_decimal_prefix(self):
+        self.assertEqual(numparse("4.0K", binary=True), 4096)
+        self.assertEqual(numparse("4.0K"), 4000)
+
+    def test_no_prefix(self):
+        self.assertEqual(numparse("123"), 123)
+        self.assertEqual(numparse(" 7.5 B "), 7.5)
+        self.assertEqual(numparse(".5"), 0.5)
+
+    def test_unit(self):
+        self.assertEqual(numparse("1.2 GB/s"), 1.2e9)
+
+    def test_negative(self):
+        self.assertEqual(numparse("-12.35 k"), -12350)
+
+    def test_exponent(self):
+        self.assertEqual(numparse("1e3 k"), 1e6)
+
+    def test_special(self):
+        self.assertEqual(numparse("inf Y"), math.inf)
+        self.assertTrue(math.isnan(numparse("nan")))
+
+    def test_custom_prefixes(self):
+        self.assertEqual(numparse("2 x", prefixes=[["x", "xi"]]), 2000)
+        self.assertEqual(numparse("2 xi", prefixes=[["x", "xi"]]), 2048)
+
+    def test_case_insensitive(self):
+        self.assertEqual(numparse("1.2g"), 1.2e9)
+        self.assertEqual(numparse("1.5g", binary=True), 1.5 * 1024**3)
+        self.assertEqual(numparse("5 m"), 5e6)
+        self.assertEqual(numparse("12 kiB"), 12 * 1024)
+        self.assertEqual(numparse("3 mb/s"), 3e6)
+
+    def test_units(self):
+        for text in ("12", "12 B", "12 b", "12 /s", "12 B/s", "12 b/s"):
+            self.assertEqual(numparse(text), 12)
+
+    def test_invalid(self):
+        for text in ("", "k", "abc", "1,024", "12.35.6 k", "1.5 k B", "5 GB!", "7 %", "5 x", "3 Hz", "2 s", "4 k!"):
+            with self.assertRaises(ValueError):
+                numparse(text)
+
+    def test_round_trip(self):
+        rand = random.Random(0)
+        fmt = "{num.real:0.09f} {num.prefix}"
+        for binary in (False, True):
+            for _ in range(1000):
+                num = rand.choice((1, -1)) * 10 ** rand.uniform(-3, 26)
+                self.assertTrue(math.isclose(numparse(str(numfmt(num, fmt=fmt, binary=binary))), num, rel_tol=1e-8, abs_tol=1e-9))
+
+    def test_round_trip_default(self):
+        for num in (0, 999, 1000, 12345, 1032456, 123000000000):
+            self.assertTrue(math.isclose(numparse(str(numfmt(num))), num, rel_tol=5e-3))
+
+    def test_many(self):
+        texts = ["12.35 k", "12.06 KiB", "4.0K", "123", "-1.5M"]
+        for binary in (False, True):
+            self.assertEqual(numparse_many(texts, binary=binary), [numparse(text, binary=binary) for text in texts])
+        self.assertEqual(numparse_many(["2 x"], prefixes=[["x", "xi"]]), [2000])
+
+
+class TestNumfmtTable(TestCase):
+    def test_table(self):
+        rows = [("name", "size"), ("a", 1500), ("bb", 12345678), ("c", 250000)]
+        self.assertEqual(
+            list(numfmt_table(rows)),
+            [
+                "name  size",
+                "a      0.00 M",
+                "bb    12.35 M",
+                "c      0.25 M",
+            ],
+        )
+
+    def test_binary(self):
+        self.assertEqual(list(numfmt_table([(2048,), (1024 * 1024,)], binary=True)), ["0.00 Mi", "1.00 Mi"])
+
+    def test_fmt_sep(self):
+        rows = [(1, 1000), (2, 2000)]
+        self.assertEqual(list(numfmt_table(rows, sep="|", fmt="{num.real:0.01f}{num.prefix}")), ["1.0|1.0k", "2.0|2.0k"])
+
+    def test_limit(self):
+        self.assertEqual(list(numfmt_table([(123000000000,)], limit=2)), ["123000.00 M"])
+
+    def test_lazy(self):
+        consumed = []
+        rows = ((consumed.append(i) or i,) for i in range(1000))
+        lines = numfmt_table(rows, sample=2)
+        self.assertEqual(next(lines), "0.00")
+        self.assertEqual(consumed, [0, 1])
+        self.assertEqual(next(lines), "1.00")
+        self.assertEqual(next(lines), "2.00")
+        self.assertEqual(consumed, [0, 1, 2])
+
+    def test_sample(self):
+        rows = [(1,), (10000,)]
+        self.assertEqual(list(numfmt_table(rows, sample=1)), ["1.00", "10000.00"])
+        self.assertEqual(list(numfmt_table(rows, sample=None)), [" 0.00 k", "10.00 k"])
+
+    def test_new_columns(self):
+        rows = [(1,), (2, 3000, "x"), (4, 5000, "yy")]
+        self.assertEqual(list(numfmt_table(rows, sample=1)), ["1.00", "2.00   3.00 k  x", "4.00   5.00 k  yy"])
+
+    def test_ragged(self):
+        rows = [("a", 1000, "b"), ("c",), (True, 2000)]
+        self.assertEqual(list(numfmt_table(rows)), ["a     1.00 k  b", "c", "True  2.00 k"])
+
+    def test_empty(self):
+        self.assertEqual(list(numfmt_table([])), [])
+
+    def test_real(self):
+        rows = [("a", fractions.Fraction(3, 2)), ("b", fractions.Fraction(12345678))]
+        self.assertEqual(list(numfmt_table(rows)), ["a   0.00 M", "b  12.35 M"])
+
+    def test_numpy(self):
+        if numpy is None:  # pragma: no cover
+            self.skipTest("numpy not available")
+        rows = [("a", numpy.int64(1500)), ("bb", numpy.int64(12345678)), ("c", numpy.float32(250000))]
+        self.assertEqual(list(numfmt_table(rows)), ["a    0.00 M", "bb  12.35 M", "c    0.25 M"])
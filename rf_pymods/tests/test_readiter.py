@@ -4,10 +4,17 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import asyncio
 import io
+import itertools
+import os
+import tempfile
+import threading
+import time
 import unittest
+import unittest.mock as mock
 
-from rf_pymods.readiter import readiter
+from rf_pymods.readiter import areaditer, readiter, readrecords
 
 
 class TestReaditer(unittest.TestCase):
@@ -34,3 +41,354 @@ class TestReaditer(unittest.TestCase):
     def test_bytes(self):
         fh = io.BytesIO(bytes(1024))
         self.assertEqual([x for x in readiter(fh)], [bytes(1024)])
+
+    def test_readinto(self):
+        fh = io.BytesIO(("?" * 1024).encode() + ("!" * 15).encode())
+        self.assertEqual([bytes(x) for x in readiter(fh, method="readinto")], [b"?" * 1024, b"!" * 15])
+
+    def test_readinto_memoryview(self):
+        fh = io.BytesIO(bytes(10))
+        blocks = list(readiter(fh, method="readinto"))
+        self.assertIsInstance(blocks[0], memoryview)
+        self.assertEqual(len(blocks[0]), 10)
+
+    def test_readinto_reuse(self):
+        fh = io.BytesIO(b"abcdef")
+        blocks = list(readiter(fh, size=2, method="readinto"))
+        # All blocks share the single buffer, which holds the last read
+        self.assertEqual([bytes(x) for x in blocks], [b"ef", b"ef", b"ef"])
+
+    def test_readinto_buffers(self):
+        fh = io.BytesIO(b"abcdef")
+        blocks = list(readiter(fh, size=2, method="readinto", buffers=3))
+        self.assertEqual([bytes(x) for x in blocks], [b"ab", b"cd", b"ef"])
+
+    def test_readinto_text(self):
+        fh = io.StringIO(("?" * 10) + ("!" * 15))
+        self.assertEqual([x for x in readiter(fh, size=10, method="readinto")], ["?" * 10, "!" * 10, "!" * 5])
+
+    def test_readinto_empty(self):
+        fh = io.BytesIO()
+        self.assertEqual(list(readiter(fh, method="readinto")), [])
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            readiter(io.BytesIO(), method="invalid")
+
+    def test_invalid_buffers(self):
+        with self.assertRaises(ValueError):
+            readiter(io.BytesIO(), method="readinto", buffers=0)
+
+
+class TestReaditerMmap(unittest.TestCase):
+    def setUp(self):
+        self.tempfile = tempfile.NamedTemporaryFile()
+        self.tempfile.write(("?" * 1024).encode() + ("!" * 15).encode())
+        self.tempfile.flush()
+
+    def tearDown(self):
+        self.tempfile.close()
+
+    def test_mmap(self):
+        with open(self.tempfile.name, "rb") as fh:
+            blocks = list(readiter(fh, method="mmap"))
+        self.assertIsInstance(blocks[0], memoryview)
+        self.assertEqual([bytes(x) for x in blocks], [b"?" * 1024, b"!" * 15])
+
+    def test_mmap_position(self):
+        with open(self.tempfile.name, "rb") as fh:
+            fh.seek(1000)
+            self.assertEqual([bytes(x) for x in readiter(fh, size=30, method="mmap")], [(b"?" * 24) + (b"!" * 6), b"!" * 9])
+            self.assertEqual(fh.tell(), 1039)
+
+    def test_mmap_early_stop(self):
+        with open(self.tempfile.name, "rb") as fh:
+            it = readiter(fh, size=10, method="mmap")
+            self.assertEqual(bytes(next(it)), b"?" * 10)
+            it.close()
+            self.assertEqual(fh.tell(), 10)
+            self.assertEqual(fh.read(5), b"?" * 5)
+
+    def test_mmap_early_stop_referenced(self):
+        with open(self.tempfile.name, "rb") as fh:
+            it = readiter(fh, size=10, method="mmap")
+            block = next(it)
+            it.close()
+            self.assertEqual(bytes(block), b"?" * 10)
+
+    def test_mmap_empty(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            with open(tf.name, "rb") as fh:
+                self.assertEqual(list(readiter(fh, method="mmap")), [])
+
+    def test_mmap_text(self):
+        with open(self.tempfile.name, "r") as fh:
+            self.assertEqual(list(readiter(fh, size=1024, method="mmap")), ["?" * 1024, "!" * 15])
+
+    def test_mmap_pipe(self):
+        r, w = os.pipe()
+        os.write(w, b"foo")
+        os.close(w)
+        with open(r, "rb") as fh:
+            self.assertEqual(list(readiter(fh, method="mmap")), [b"foo"])
+
+    def test_mmap_bytesio(self):
+        fh = io.BytesIO(b"foo")
+        self.assertEqual(list(readiter(fh, method="mmap")), [b"foo"])
+
+
+class TestReaditerPrefetch(unittest.TestCase):
+    def assertNoPrefetchThread(self):
+        self.assertFalse([t for t in threading.enumerate() if t.name == "readiter-prefetch"])
+
+    def test_prefetch(self):
+        fh = io.StringIO(("?" * 10) + ("!" * 15))
+        self.assertEqual([x for x in readiter(fh, size=10, prefetch=2)], ["?" * 10, "!" * 10, "!" * 5])
+        self.assertNoPrefetchThread()
+
+    def test_prefetch_readinto(self):
+        fh = io.BytesIO(bytes(range(100)))
+        blocks = [bytes(x) for x in readiter(fh, size=10, method="readinto", prefetch=4)]
+        self.assertEqual(blocks, [bytes(range(i, i + 10)) for i in range(0, 100, 10)])
+
+    def test_prefetch_readinto_buffers(self):
+        """Test earlier blocks stay valid until their buffers are reused"""
+        for buffers in (1, 3, 4):
+            it = readiter(io.BytesIO(bytes(range(100))), size=10, method="readinto", buffers=buffers, prefetch=2)
+            # The first block must survive buffers - 1 further advances
+            blocks = [next(it) for _ in range(buffers)]
+            expected = [bytes(range(i * 10, i * 10 + 10)) for i in range(buffers)]
+            # Give the worker time to read ahead as far as it can
+            time.sleep(0.1)
+            self.assertEqual([bytes(block) for block in blocks], expected)
+            it.close()
+
+    def test_prefetch_mmap(self):
+        with tempfile.NamedTemporaryFile() as tf:
+            tf.write(b"?" * 1039)
+            tf.flush()
+            with open(tf.name, "rb") as fh:
+                self.assertEqual([bytes(x) for x in readiter(fh, method="mmap", prefetch=2)], [b"?" * 1024, b"?" * 15])
+                self.assertEqual(fh.tell(), 1039)
+
+    def test_prefetch_early_stop(self):
+        fh = io.BytesIO(bytes(10000))
+        it = readiter(fh, size=10, prefetch=2)
+        self.assertEqual(next(it), bytes(10))
+        it.close()
+        self.assertNoPrefetchThread()
+        self.assertLess(fh.tell(), 10000)
+
+    def test_prefetch_early_stop_slow(self):
+        """Test stopping early while the worker is blocked on a read"""
+
+        def _read(size):
+            time.sleep(0.05)
+            return bytes(size)
+
+        fh = mock.Mock(spec=["read"])
+        fh.read.side_effect = _read
+        it = readiter(fh, size=10, prefetch=2)
+        self.assertEqual(next(it), bytes(10))
+        it.close()
+        self.assertNoPrefetchThread()
+
+    def test_prefetch_exception(self):
+        fh = mock.Mock(spec=["read"])
+        fh.read.side_effect = [bytes(10), OSError]
+        it = readiter(fh, size=10, prefetch=2)
+        self.assertEqual(next(it), bytes(10))
+        with self.assertRaises(OSError):
+            next(it)
+        self.assertNoPrefetchThread()
+
+
+class TestReaditerAutosize(unittest.TestCase):
+    def setUp(self):
+        self.tempfile = tempfile.NamedTemporaryFile()
+        self.tempfile.write(bytes(range(256)) * 1024)
+        self.tempfile.flush()
+
+    def tearDown(self):
+        self.tempfile.close()
+
+    @mock.patch("rf_pymods.readiter.time.perf_counter", side_effect=itertools.count())
+    def test_auto_grow(self, perf_counter):
+        """Constant time per read means throughput improves with size"""
+        fh = io.BytesIO(bytes(100000))
+        blocks = list(readiter(fh, size="auto", max_size=32768))
+        self.assertEqual([len(x) for x in blocks], [io.DEFAULT_BUFFER_SIZE, 16384, 32768, 32768, 9888])
+
+    @mock.patch("rf_pymods.readiter.time.perf_counter", side_effect=itertools.accumulate([0, 1, 0, 1, 0, 10] + [0, 1] * 10))
+    def test_auto_settle(self, perf_counter):
+        """Throughput dropping at 32768 settles back on 16384"""
+        fh = io.BytesIO(bytes(100000))
+        blocks = list(readiter(fh, size="auto"))
+        self.assertEqual([len(x) for x in blocks], [8192, 16384, 32768, 16384, 16384, 9888])
+
+    @mock.patch("rf_pymods.readiter.time.perf_counter", return_value=0)
+    def test_auto_zero_elapsed(self, perf_counter):
+        fh = io.BytesIO(bytes(100000))
+        blocks = list(readiter(fh, size="auto", max_size=16384))
+        self.assertEqual([len(x) for x in blocks], [8192] + [16384] * 5 + [9888])
+
+    def test_auto_file(self):
+        with open(self.tempfile.name, "rb") as fh:
+            blocks = list(readiter(fh, size="auto"))
+            self.assertEqual(len(blocks[0]), min(os.fstat(fh.fileno()).st_blksize, 4194304))
+        self.assertEqual(b"".join(blocks), bytes(range(256)) * 1024)
+
+    def test_auto_readinto(self):
+        with open(self.tempfile.name, "rb") as fh:
+            blocks = [bytes(x) for x in readiter(fh, size="auto", method="readinto")]
+        self.assertEqual(b"".join(blocks), bytes(range(256)) * 1024)
+
+    def test_auto_mmap(self):
+        with open(self.tempfile.name, "rb") as fh:
+            blocks = list(readiter(fh, size="auto", method="mmap", max_size=65536))
+            self.assertEqual([len(x) for x in blocks], [65536] * 4)
+
+    def test_auto_text(self):
+        fh = io.StringIO("?" * 10000)
+        self.assertEqual(list(readiter(fh, size="auto", max_size=1000)), ["?" * 1000] * 10)
+
+    @mock.patch("rf_pymods.readiter.os.posix_fadvise")
+    def test_auto_fadvise(self, posix_fadvise):
+        with open(self.tempfile.name, "rb") as fh:
+            list(readiter(fh, size="auto"))
+            posix_fadvise.assert_called_once_with(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    @mock.patch("rf_pymods.readiter.os.posix_fadvise")
+    def test_dontneed(self, posix_fadvise):
+        with open(self.tempfile.name, "rb") as fh:
+            fh.seek(100)
+            blocks = list(readiter(fh, size=100000, dontneed=True))
+            self.assertEqual(
+                posix_fadvise.call_args_list,
+                [
+                    mock.call(fh.fileno(), 100, 100000, os.POSIX_FADV_DONTNEED),
+                    mock.call(fh.fileno(), 98304, 101796, os.POSIX_FADV_DONTNEED),
+                    mock.call(fh.fileno(), 196608, 65536, os.POSIX_FADV_DONTNEED),
+                ],
+            )
+        self.assertEqual(b"".join(blocks), (bytes(range(256)) * 1024)[100:])
+
+    @mock.patch("rf_pymods.readiter.os.posix_fadvise")
+    def test_dontneed_text(self, posix_fadvise):
+        fh = io.StringIO("?" * 10)
+        self.assertEqual(list(readiter(fh, dontneed=True)), ["?" * 10])
+        posix_fadvise.assert_not_called()
+
+
+class TestReadrecords(unittest.TestCase):
+    def test_lines(self):
+        fh = io.BytesIO(b"foo\nbar\n\nbaz\n")
+        self.assertEqual(list(readrecords(fh)), [b"foo", b"bar", b"", b"baz"])
+
+    def test_no_trailing_delimiter(self):
+        fh = io.BytesIO(b"foo\nbar")
+        self.assertEqual(list(readrecords(fh)), [b"foo", b"bar"])
+
+    def test_text(self):
+        fh = io.StringIO("foo\nbar\n")
+        self.assertEqual(list(readrecords(fh)), ["foo", "bar"])
+
+    def test_nul(self):
+        fh = io.BytesIO(b"foo\0bar\0")
+        self.assertEqual(list(readrecords(fh, delimiter=b"\0")), [b"foo", b"bar"])
+
+    def test_empty(self):
+        self.assertEqual(list(readrecords(io.BytesIO())), [])
+
+    def test_across_blocks(self):
+        fh = io.BytesIO(b"foo\nbarbazquux\nx\n")
+        self.assertEqual(list(readrecords(fh, size=2)), [b"foo", b"barbazquux", b"x"])
+
+    def test_straddling_delimiter(self):
+        fh = io.BytesIO(b"foo\r\nbar\r\nbaz")
+        self.assertEqual(list(readrecords(fh, delimiter=b"\r\n", size=4)), [b"foo", b"bar", b"baz"])
+
+    def test_matches_split(self):
+        data = b"a\r\n\r\nbb\rb\r\n\nccc\r\n" * 10
+        for size in range(1, 12):
+            self.assertEqual(list(readrecords(io.BytesIO(data), delimiter=b"\r\n", size=size)), data.split(b"\r\n")[:-1])
+
+    def test_readinto(self):
+        fh = io.BytesIO(b"foo\nbar\nbaz")
+        self.assertEqual(list(readrecords(fh, size=2, method="readinto")), [b"foo", b"bar", b"baz"])
+
+    def test_max_length(self):
+        fh = io.BytesIO(b"foo\nbarbaz\n")
+        self.assertEqual(list(readrecords(fh, max_length=6)), [b"foo", b"barbaz"])
+
+    def test_max_length_exceeded(self):
+        fh = io.BytesIO(b"foo\nbarbaz\n")
+        with self.assertRaises(ValueError):
+            list(readrecords(fh, max_length=5))
+
+    def test_max_length_exceeded_across_blocks(self):
+        fh = io.BytesIO(b"foo\nbarbaz\n")
+        it = readrecords(fh, size=2, max_length=5)
+        self.assertEqual(next(it), b"foo")
+        with self.assertRaises(ValueError):
+            next(it)
+
+    def test_max_length_exceeded_unterminated(self):
+        fh = io.BytesIO(b"foobarbaz" * 100)
+        with self.assertRaises(ValueError):
+            list(readrecords(fh, size=10, max_length=50))
+
+
+class TestAreaditer(unittest.IsolatedAsyncioTestCase):
+    async def test_stream_reader(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(("?" * 1024).encode() + ("!" * 15).encode())
+        reader.feed_eof()
+        self.assertEqual([x async for x in areaditer(reader)], [b"?" * 1024, b"!" * 15])
+
+    async def test_filehandle(self):
+        fh = io.StringIO(("?" * 10) + ("!" * 15))
+        self.assertEqual([x async for x in areaditer(fh, size=10)], ["?" * 10, "!" * 10, "!" * 5])
+
+    async def test_blocking_fd(self):
+        r, w = os.pipe()
+        os.write(w, b"foo")
+        os.close(w)
+        try:
+            self.assertEqual([x async for x in areaditer(r)], [b"foo"])
+        finally:
+            os.close(r)
+
+    async def test_nonblocking_fd(self):
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+
+        def _write():
+            os.write(w, b"foo")
+            os.close(w)
+
+        asyncio.get_running_loop().call_later(0.01, _write)
+        try:
+            self.assertEqual([x async for x in areaditer(r)], [b"foo"])
+        finally:
+            os.close(r)
+
+    async def test_auto_size(self):
+        with tempfile.TemporaryFile() as fh:
+            fh.write(b"?" * 100)
+            fh.seek(0)
+            with mock.patch("rf_pymods.readiter.os.fstat", return_value=mock.Mock(st_blksize=40)):
+                self.assertEqual([len(x) async for x in areaditer(fh, size="auto")], [40, 40, 20])
+
+    async def test_auto_size_fd(self):
+        r, w = os.pipe()
+        os.write(w, b"foo")
+        os.close(w)
+        try:
+            self.assertEqual([x async for x in areaditer(r, size="auto")], [b"foo"])
+        finally:
+            os.close(r)
+
+    async def test_auto_size_no_fileno(self):
+        fh = io.BytesIO(b"?" * (io.DEFAULT_BUFFER_SIZE + 1))
+        self.assertEqual([len(x) async for x in areaditer(fh, size="auto")], [io.DEFAULT_BUFFER_SIZE, 1])
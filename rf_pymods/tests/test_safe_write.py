@@ -4,11 +4,15 @@
 # SPDX-FileCopyrightText: © 2020 Ryan Finnie <ryan@finnie.org>
 # SPDX-License-Identifier: MIT
 
+import concurrent.futures
+import io
+import os
+import tempfile
 import unittest
 import unittest.mock as mock
 
 from . import decorated_mocks
-from rf_pymods.safe_write import safe_write
+from rf_pymods.safe_write import SafeWriteTransaction, flush_all, safe_write
 
 
 @mock.patch("rf_pymods.safe_write.open", new_callable=mock.mock_open)
@@ -54,3 +58,511 @@ class TestSafeWrite(unittest.TestCase):
         with safe_write("foo", preserve_stats=False):
             pass
         mocks["copystat"].assert_not_called()
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Run each test in a new temporary directory, self.path"""
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+
+class TestSafeWriteFilesystem(TempDirTestCase):
+    def test_write(self):
+        filename = os.path.join(self.path, "foo")
+        with safe_write(filename) as f:
+            f.write("bar")
+        with open(filename) as f:
+            self.assertEqual(f.read(), "bar")
+        self.assertEqual(os.listdir(self.path), ["foo"])
+
+    def test_invalid_durability(self):
+        with self.assertRaises(ValueError):
+            safe_write(os.path.join(self.path, "foo"), durability="invalid")
+        self.assertEqual(os.listdir(self.path), [])
+
+    @mock.patch("rf_pymods.safe_write._fsync_dir")
+    @mock.patch("rf_pymods.safe_write.os.fsync")
+    @mock.patch("rf_pymods.safe_write.os.fdatasync")
+    def test_durability_none(self, fdatasync, fsync, fsync_dir):
+        with safe_write(os.path.join(self.path, "foo")) as f:
+            f.write("bar")
+        fdatasync.assert_not_called()
+        fsync.assert_not_called()
+        fsync_dir.assert_not_called()
+
+    @mock.patch("rf_pymods.safe_write._fsync_dir")
+    @mock.patch("rf_pymods.safe_write.os.fsync")
+    @mock.patch("rf_pymods.safe_write.os.fdatasync")
+    def test_durability_data(self, fdatasync, fsync, fsync_dir):
+        with safe_write(os.path.join(self.path, "foo"), durability="data") as f:
+            fileno = f.fileno()
+            f.write("bar")
+        fdatasync.assert_called_once_with(fileno)
+        fsync.assert_not_called()
+        fsync_dir.assert_not_called()
+
+    @mock.patch("rf_pymods.safe_write._fsync_dir")
+    @mock.patch("rf_pymods.safe_write.os.fsync")
+    @mock.patch("rf_pymods.safe_write.os.fdatasync")
+    def test_durability_full(self, fdatasync, fsync, fsync_dir):
+        with safe_write(os.path.join(self.path, "foo"), durability="full") as f:
+            fileno = f.fileno()
+            f.write("bar")
+        fdatasync.assert_not_called()
+        fsync.assert_called_once_with(fileno)
+        fsync_dir.assert_called_once_with(self.path)
+
+    def test_durability_full_real(self):
+        with safe_write(os.path.join(self.path, "foo"), durability="full") as f:
+            f.write("bar")
+        with open(os.path.join(self.path, "foo")) as f:
+            self.assertEqual(f.read(), "bar")
+
+    @unittest.skipUnless(hasattr(os, "O_TMPFILE"), "O_TMPFILE not supported")
+    def test_tmpfile(self):
+        filename = os.path.join(self.path, "foo")
+        with open(filename, "w") as f:
+            f.write("old")
+        os.chmod(filename, 0o600)
+        with safe_write(filename, tmpfile=True, durability="full") as f:
+            f.write("bar")
+            self.assertEqual(os.listdir(self.path), ["foo"])
+        self.assertEqual(os.listdir(self.path), ["foo"])
+        self.assertEqual(os.stat(filename).st_mode & 0o777, 0o600)
+        with open(filename) as f:
+            self.assertEqual(f.read(), "bar")
+
+    @unittest.skipUnless(hasattr(os, "O_TMPFILE"), "O_TMPFILE not supported")
+    def test_tmpfile_rename_failure(self):
+        f = safe_write(os.path.join(self.path, "foo"), tmpfile=True)
+        f.write("bar")
+        with mock.patch("rf_pymods.safe_write.os.rename", side_effect=OSError):
+            with self.assertRaises(OSError):
+                f.close()
+        self.assertEqual(os.listdir(self.path), [])
+
+    @mock.patch("rf_pymods.safe_write.os.open", side_effect=OSError)
+    def test_tmpfile_unsupported(self, os_open):
+        with safe_write(os.path.join(self.path, "foo"), tmpfile=True) as f:
+            f.write("bar")
+            self.assertEqual(len(os.listdir(self.path)), 1)
+            self.assertNotEqual(os.listdir(self.path), ["foo"])
+        with open(os.path.join(self.path, "foo")) as f:
+            self.assertEqual(f.read(), "bar")
+
+
+class TestSafeWritePopulate(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.path, "foo")
+        self.data = bytes(range(256)) * 8192
+        with open(self.filename, "wb") as f:
+            f.write(self.data)
+
+    def assertPatched(self):
+        with open(self.filename, "rb") as f:
+            self.assertEqual(f.read(), self.data[:1000000] + b"bar" + self.data[1000003:])
+        self.assertEqual(os.listdir(self.path), ["foo"])
+
+    def patch(self, **kwargs):
+        with safe_write(self.filename, mode="xb", populate=True, **kwargs) as f:
+            self.assertEqual(f.tell(), 0)
+            f.seek(1000000)
+            f.write(b"bar")
+
+    def test_populate(self):
+        self.patch()
+        self.assertPatched()
+
+    def test_populate_tmpfile(self):
+        self.patch(tmpfile=True)
+        self.assertPatched()
+
+    def test_populate_missing(self):
+        os.unlink(self.filename)
+        with safe_write(self.filename, populate=True) as f:
+            f.write("bar")
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "bar")
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl")
+    def test_populate_ficlone(self, ioctl):
+        with safe_write(self.filename, mode="xb", populate=True) as f:
+            fileno = f.fileno()
+        ioctl.assert_called_once()
+        self.assertEqual(ioctl.call_args[0][0], fileno)
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl", side_effect=OSError)
+    def test_populate_copy_file_range(self, ioctl):
+        self.patch()
+        self.assertPatched()
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.copy_file_range", side_effect=OSError)
+    def test_populate_sendfile(self, copy_file_range, ioctl):
+        self.patch()
+        self.assertPatched()
+        copy_file_range.assert_called_once()
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.copy_file_range", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.sendfile", side_effect=OSError)
+    def test_populate_copy(self, sendfile, copy_file_range, ioctl):
+        self.patch()
+        self.assertPatched()
+        sendfile.assert_called_once()
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.copy_file_range", return_value=0)
+    @mock.patch("rf_pymods.safe_write.os.sendfile", return_value=0)
+    def test_populate_short(self, sendfile, copy_file_range, ioctl):
+        """Test methods which stop short fall through to the next"""
+        self.patch()
+        self.assertPatched()
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.copy_file_range", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.sendfile", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.pread", return_value=b"")
+    def test_populate_truncated(self, pread, sendfile, copy_file_range, ioctl):
+        """Test the source file shrinking during the copy"""
+        with safe_write(self.filename, mode="xb", populate=True):
+            pass
+        self.assertEqual(os.stat(self.filename).st_size, 0)
+
+    @mock.patch("rf_pymods.safe_write.fcntl.ioctl", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.copy_file_range", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.sendfile", side_effect=OSError)
+    @mock.patch("rf_pymods.safe_write.os.pread", side_effect=OSError)
+    def test_populate_failure(self, pread, sendfile, copy_file_range, ioctl):
+        with self.assertRaises(OSError):
+            safe_write(self.filename, mode="xb", populate=True)
+        self.assertEqual(os.listdir(self.path), ["foo"])
+
+
+class TestSafeWriteBackground(TempDirTestCase):
+    def test_background(self):
+        filename = os.path.join(self.path, "foo")
+        f = safe_write(filename, durability="full", background=True)
+        f.write("bar")
+        future = f.close()
+        self.assertIsInstance(future, concurrent.futures.Future)
+        self.assertIs(f.close(), future)
+        future.result()
+        self.assertTrue(f.closed)
+        with open(filename) as f:
+            self.assertEqual(f.read(), "bar")
+
+    def test_background_context(self):
+        for i in range(10):
+            with safe_write(os.path.join(self.path, "foo{}".format(i)), background=True) as f:
+                f.write("bar")
+        flush_all()
+        self.assertEqual(len(os.listdir(self.path)), 10)
+
+    def test_background_closed(self):
+        f = safe_write(os.path.join(self.path, "foo"), background=True)
+        f._fh_close()
+        self.assertIsNone(f.close())
+
+    @mock.patch("rf_pymods.safe_write.os.rename", side_effect=OSError)
+    def test_background_error(self, rename):
+        future = safe_write(os.path.join(self.path, "foo"), background=True).close()
+        with self.assertRaises(OSError):
+            future.result()
+        self.assertEqual(os.listdir(self.path), [])
+        with self.assertRaises(OSError):
+            flush_all()
+
+    @mock.patch("rf_pymods.safe_write.os.rename", side_effect=OSError)
+    def test_flush_all_error(self, rename):
+        safe_write(os.path.join(self.path, "foo"), background=True).close()
+        with self.assertRaises(OSError):
+            flush_all()
+
+    def test_flush_all_finished_error(self):
+        os.mkdir(os.path.join(self.path, "foo"))
+        with safe_write(os.path.join(self.path, "foo"), background=True) as f:
+            f.write("bar")
+        concurrent.futures.wait([f.close()])
+        with self.assertRaises(OSError):
+            flush_all()
+        self.assertEqual(os.listdir(self.path), ["foo"])
+        flush_all()
+
+    def test_flush_all_empty(self):
+        flush_all()
+
+
+class TestSafeWriteSizeHint(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.path, "foo")
+
+    def test_size_hint(self):
+        with safe_write(self.filename, mode="xb", size_hint=1048576) as f:
+            self.assertEqual(os.fstat(f.fileno()).st_size, 1048576)
+            f.write(b"bar" * 1000)
+        self.assertEqual(os.stat(self.filename).st_size, 3000)
+
+    def test_size_hint_seek(self):
+        with safe_write(self.filename, mode="xb", size_hint=1048576) as f:
+            f.write(b"\0" * 8 + b"bar" * 1000)
+            f.seek(0)
+            f.write(b"header!\n")
+        with open(self.filename, "rb") as f:
+            self.assertEqual(f.read(), b"header!\n" + b"bar" * 1000)
+
+    def test_size_hint_seek_text(self):
+        with safe_write(self.filename, size_hint=1048576) as f:
+            f.write("bar" * 1000)
+            f.seek(0)
+            f.write("foo")
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "foo" + "bar" * 999)
+
+    def test_size_hint_truncate(self):
+        with safe_write(self.filename, mode="xb", size_hint=1048576) as f:
+            f.write(b"bar" * 1000)
+            self.assertEqual(f.truncate(100), 100)
+        self.assertEqual(os.stat(self.filename).st_size, 100)
+        with safe_write(self.filename, mode="wb", size_hint=1048576) as f:
+            f.write(b"bar" * 1000)
+            f.truncate(100)
+            f.write(b"baz")
+        self.assertEqual(os.stat(self.filename).st_size, 3003)
+
+    def test_size_hint_seek_end(self):
+        with safe_write(self.filename, mode="xb", size_hint=65536) as f:
+            f.write(b"abc")
+            self.assertEqual(f.seek(0, os.SEEK_END), 3)
+            f.write(b"def")
+            self.assertEqual(f.seek(-1, os.SEEK_END), 5)
+            f.write(b"g")
+        with open(self.filename, "rb") as f:
+            self.assertEqual(f.read(), b"abcdeg")
+
+    def test_size_hint_truncate_seek(self):
+        with safe_write(self.filename, mode="xb", size_hint=65536) as f:
+            f.write(b"x" * 100)
+            f.truncate(10)
+            f.seek(0)
+            f.write(b"y")
+        with open(self.filename, "rb") as f:
+            self.assertEqual(f.read(), b"y" + b"x" * 9)
+
+    def test_size_hint_exceeded(self):
+        with safe_write(self.filename, size_hint=10) as f:
+            f.write("bar" * 1000)
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), "bar" * 1000)
+
+    def test_size_hint_tmpfile(self):
+        with safe_write(self.filename, mode="xb", size_hint=1048576, tmpfile=True, durability="data") as f:
+            f.write(b"bar")
+        self.assertEqual(os.stat(self.filename).st_size, 3)
+
+    @mock.patch("rf_pymods.safe_write.os.posix_fallocate", side_effect=OSError)
+    def test_size_hint_unsupported(self, posix_fallocate):
+        with safe_write(self.filename, mode="xb", size_hint=1048576) as f:
+            f.write(b"bar")
+        posix_fallocate.assert_called_once()
+        self.assertEqual(os.stat(self.filename).st_size, 3)
+
+    def test_size_hint_populate(self):
+        with self.assertRaises(ValueError):
+            safe_write(self.filename, size_hint=1048576, populate=True)
+
+    @mock.patch("rf_pymods.safe_write.os.posix_fallocate")
+    @mock.patch("rf_pymods.safe_write.open", new_callable=mock.mock_open)
+    def test_size_hint_buffering(self, mock_open, posix_fallocate):
+        safe_write(self.filename, mode="xb", size_hint=2**30)
+        self.assertEqual(mock_open.call_args[1]["buffering"], 1048576)
+        safe_write(self.filename, mode="xb", size_hint=100)
+        self.assertEqual(mock_open.call_args[1]["buffering"], io.DEFAULT_BUFFER_SIZE)
+        safe_write(self.filename, mode="xb", size_hint=2**30, buffering=4096)
+        self.assertEqual(mock_open.call_args[1]["buffering"], 4096)
+        safe_write(self.filename, mode="x", size_hint=2**30)
+        self.assertNotIn("buffering", mock_open.call_args[1])
+
+
+class TestSafeWriteSkipUnchanged(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.path, "foo")
+        with open(self.filename, "w") as f:
+            f.write("bar" * 1000000)
+        self.inode = os.stat(self.filename).st_ino
+
+    def write(self, data, **kwargs):
+        with safe_write(self.filename, skip_unchanged=True, **kwargs) as f:
+            f.write(data)
+        self.assertEqual(os.listdir(self.path), ["foo"])
+        return f
+
+    def test_unchanged(self):
+        f = self.write("bar" * 1000000)
+        self.assertFalse(f.committed)
+        self.assertEqual(os.stat(self.filename).st_ino, self.inode)
+
+    def test_changed(self):
+        f = self.write("bar" * 999999 + "baz")
+        self.assertTrue(f.committed)
+        self.assertNotEqual(os.stat(self.filename).st_ino, self.inode)
+
+    def test_changed_size(self):
+        f = self.write("bar")
+        self.assertTrue(f.committed)
+
+    def test_changed_mode(self):
+        with safe_write(self.filename, skip_unchanged=True) as f:
+            os.fchmod(f.fileno(), 0o600)
+            f.write("bar" * 1000000)
+        self.assertTrue(f.committed)
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o600)
+
+    def test_missing(self):
+        os.unlink(self.filename)
+        f = self.write("bar")
+        self.assertTrue(f.committed)
+
+    @mock.patch("rf_pymods.safe_write._fsync_dir")
+    @mock.patch("rf_pymods.safe_write.os.fsync")
+    def test_unchanged_durability(self, fsync, fsync_dir):
+        f = self.write("bar" * 1000000, durability="full")
+        self.assertFalse(f.committed)
+        fsync.assert_not_called()
+        fsync_dir.assert_not_called()
+
+    @unittest.skipUnless(hasattr(os, "O_TMPFILE"), "O_TMPFILE not supported")
+    def test_unchanged_tmpfile(self):
+        f = self.write("bar" * 1000000, tmpfile=True)
+        self.assertFalse(f.committed)
+        self.assertTrue(f.closed)
+        self.assertEqual(os.stat(self.filename).st_ino, self.inode)
+
+    def test_unchanged_background(self):
+        f = safe_write(self.filename, skip_unchanged=True, background=True)
+        f.write("bar" * 1000000)
+        self.assertFalse(f.close().result())
+        f = safe_write(self.filename, skip_unchanged=True, background=True)
+        f.write("baz")
+        self.assertTrue(f.close().result())
+
+    @mock.patch("rf_pymods.safe_write._fsync_dir")
+    def test_unchanged_transaction(self, fsync_dir):
+        with SafeWriteTransaction() as txn:
+            unchanged = txn.open(self.filename, skip_unchanged=True)
+            unchanged.write("bar" * 1000000)
+        self.assertFalse(unchanged.committed)
+        fsync_dir.assert_not_called()
+        self.assertEqual(os.listdir(self.path), ["foo"])
+
+
+class TestSafeWriteTransaction(TempDirTestCase):
+    def read(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read()
+
+    def test_commit(self):
+        with SafeWriteTransaction() as txn:
+            for i in range(3):
+                with txn.open(os.path.join(self.path, "shard{}".format(i))) as f:
+                    f.write("shard {}".format(i))
+                # Closing does not move the file into place
+                self.assertFalse(os.path.exists(os.path.join(self.path, "shard{}".format(i))))
+        self.assertEqual(sorted(os.listdir(self.path)), ["shard0", "shard1", "shard2"])
+        self.assertEqual(self.read("shard1"), "shard 1")
+        self.assertEqual(txn.handles, [])
+
+    def test_commit_unclosed(self):
+        with SafeWriteTransaction() as txn:
+            f = txn.open(os.path.join(self.path, "foo"))
+            f.write("bar")
+        self.assertTrue(f.closed)
+        self.assertEqual(self.read("foo"), "bar")
+
+    @mock.patch("rf_pymods.safe_write.os.fsync")
+    def test_fsync_per_directory(self, fsync):
+        os.mkdir(os.path.join(self.path, "sub"))
+        with SafeWriteTransaction() as txn:
+            for i in range(3):
+                txn.open(os.path.join(self.path, "shard{}".format(i))).write("foo")
+                txn.open(os.path.join(self.path, "sub", "shard{}".format(i))).write("foo")
+        self.assertEqual(fsync.call_count, 2)
+
+    def test_rollback(self):
+        with open(os.path.join(self.path, "foo"), "w") as f:
+            f.write("old")
+        with self.assertRaises(RuntimeError):
+            with SafeWriteTransaction() as txn:
+                txn.open(os.path.join(self.path, "foo")).write("new")
+                txn.open(os.path.join(self.path, "bar")).write("new")
+                raise RuntimeError
+        self.assertEqual(os.listdir(self.path), ["foo"])
+        self.assertEqual(self.read("foo"), "old")
+
+    def test_rollback_close_failure(self):
+        with self.assertRaises(OSError):
+            with SafeWriteTransaction() as txn:
+                txn.open(os.path.join(self.path, "foo")).write("new")
+                f = txn.open(os.path.join(self.path, "bar"))
+                f._fh_close = mock.MagicMock(side_effect=OSError)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_rollback_rename_failure(self):
+        """Test a failed move removes the remaining temporary files"""
+        rename = os.rename
+
+        def _rename(src, dst):
+            if dst.endswith("bar"):
+                raise OSError
+            rename(src, dst)
+
+        txn = SafeWriteTransaction()
+        for name in ("foo", "bar", "baz"):
+            txn.open(os.path.join(self.path, name)).write("new")
+        with mock.patch("rf_pymods.safe_write.os.rename", side_effect=_rename):
+            with self.assertRaises(OSError):
+                txn.commit()
+        self.assertEqual(os.listdir(self.path), ["foo"])
+        self.assertEqual(txn.handles, [])
+
+    def test_rollback_missing_tempfile(self):
+        txn = SafeWriteTransaction()
+        f = txn.open(os.path.join(self.path, "foo"))
+        os.unlink(f.name)
+        txn.rollback()
+        self.assertEqual(os.listdir(self.path), [])
+
+    @unittest.skipUnless(hasattr(os, "O_TMPFILE"), "O_TMPFILE not supported")
+    def test_tmpfile(self):
+        with SafeWriteTransaction() as txn:
+            txn.open(os.path.join(self.path, "foo"), tmpfile=True).write("foo")
+            with txn.open(os.path.join(self.path, "bar"), tmpfile=True) as f:
+                f.write("bar")
+            self.assertEqual(os.listdir(self.path), [])
+        self.assertEqual(sorted(os.listdir(self.path)), ["bar", "foo"])
+        self.assertEqual(self.read("bar"), "bar")
+
+    @unittest.skipUnless(hasattr(os, "O_TMPFILE"), "O_TMPFILE not supported")
+    def test_tmpfile_rollback(self):
+        with self.assertRaises(RuntimeError):
+            with SafeWriteTransaction() as txn:
+                txn.open(os.path.join(self.path, "foo"), tmpfile=True).write("foo")
+                raise RuntimeError
+        self.assertEqual(os.listdir(self.path), [])
+
+    @mock.patch("rf_pymods.safe_write._fsync_dir")
+    @mock.patch("rf_pymods.safe_write.os.fsync")
+    def test_durability_full(self, fsync, fsync_dir):
+        with SafeWriteTransaction() as txn:
+            for i in range(3):
+                txn.open(os.path.join(self.path, "shard{}".format(i)), durability="full").write("foo")
+        self.assertEqual(fsync.call_count, 3)
+        fsync_dir.assert_called_once_with(self.path)